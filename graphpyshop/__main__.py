@@ -1,32 +1,73 @@
 import argparse
-import ast
 import functools
+import importlib
 import logging.config
 import os
 import shutil
+import sys
 import time
-from functools import lru_cache
+import types
+from typing import TYPE_CHECKING, Any, List
 
-from ariadne_codegen.config import get_client_settings, get_config_dict
-from dotenv import find_dotenv, load_dotenv
+if TYPE_CHECKING:
+    import ast
 
-logging.basicConfig(level=logging.INFO)
+_ARIADNE_PATCHED = False
+_HTTPX_PATCHED = False
+_DOTENV_LOADED = False
+_LOG_CONFIGURED = False
+
+_LOG_CONFIG = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "standard": {"format": "%(asctime)s [%(levelname)s] %(name)s: %(message)s"}
+    },
+    "handlers": {
+        "default": {
+            "level": "INFO",
+            "formatter": "standard",
+            "class": "logging.StreamHandler",
+        }
+    },
+    "loggers": {"": {"handlers": ["default"], "level": "INFO", "propagate": True}},
+}
+
+
+class LazyModule(types.ModuleType):
+    """Module proxy that imports the real module on first attribute access"""
+
+    def _load(self) -> types.ModuleType:
+        module = importlib.import_module(self.__name__)
+        # Later lookups go straight to the loaded module's namespace
+        self.__dict__.update(module.__dict__)
+        return module
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self._load(), item)
+
+    def __dir__(self) -> List[str]:
+        return dir(self._load())
+
+
+ariadne_main = LazyModule("ariadne_codegen.main")
 
 
 class TimedLog:
     def __init__(self, name: str):
         self.name = name
+        self.log = logging.info
 
     def __enter__(self):
-        self.start = time.time()
+        self.start = time.perf_counter_ns()
 
     def __exit__(self, *args):
-        duration = (time.time() - self.start) * 1000
-        logging.info(f"{self.name} took {duration:.1f} ms")
+        duration = (time.perf_counter_ns() - self.start) / 1_000_000
+        self.log("%s took %.1f ms", self.name, duration)
 
 
 def _simple_ast_to_str(
-    ast_obj: ast.AST,
+    ast_obj: "ast.AST",
     remove_unused_imports: bool = True,
     multiline_strings: bool = False,
     multiline_strings_offset: int = 4,
@@ -36,19 +77,32 @@ def _simple_ast_to_str(
 
     Doesn't do expensive autoformatting like default does
     """
+    import ast  # noqa: PLC0415
+
     return ast.unparse(ast_obj)
 
 
-@lru_cache
 def monkeypatch_ariadne_codegen():
+    global _ARIADNE_PATCHED
+    if _ARIADNE_PATCHED:
+        return
+
     from ariadne_codegen.client_generators import package
 
     package.ast_to_str = _simple_ast_to_str
+    _ARIADNE_PATCHED = True
 
 
-@lru_cache
 def monkey_patch_httpx():
-    """Wrap all the httpx functions to have a default timeout of 30 (get, post, etc)"""
+    """Wrap all the httpx functions to have a default timeout of 90 (get, post, etc)
+
+    Only needed for schema introspection, which ariadne_codegen does through the
+    module level httpx functions. The generated client sets its own timeout.
+    """
+    global _HTTPX_PATCHED
+    if _HTTPX_PATCHED:
+        return
+
     import httpx
     from httpx import Timeout
 
@@ -56,7 +110,6 @@ def monkey_patch_httpx():
 
     original_get = httpx.get
 
-    @functools.wraps(httpx.get)
     def get(*args, **kwargs):
         if "timeout" not in kwargs:
             kwargs["timeout"] = new_timeout
@@ -66,40 +119,63 @@ def monkey_patch_httpx():
 
     original_post = httpx.post
 
-    @functools.wraps(httpx.post)
     def post(*args, **kwargs):
         if "timeout" not in kwargs:
             kwargs["timeout"] = new_timeout
         return original_post(*args, **kwargs)
 
     httpx.post = post
+    _HTTPX_PATCHED = True
 
 
-def generate_client():
-    from ariadne_codegen.main import client
+def _ensure_dotenv():
+    global _DOTENV_LOADED
+    if _DOTENV_LOADED:
+        return
 
-    logging.info("Starting generation of client")
+    from dotenv import find_dotenv, load_dotenv
 
     load_dotenv(find_dotenv())
-    config_dict = get_config_dict()
+    _DOTENV_LOADED = True
+
+
+@functools.lru_cache(maxsize=1)
+def _config_dict() -> dict:
+    from ariadne_codegen.config import get_config_dict
+
+    return get_config_dict()
+
+
+@functools.lru_cache(maxsize=1)
+def _client_settings():
+    from ariadne_codegen.config import get_client_settings
+
+    return get_client_settings(_config_dict())
+
+
+def generate_client():
+    logging.info("Starting generation of client")
+
+    _ensure_dotenv()
+    monkey_patch_httpx()
+    config_dict = _config_dict()
     with TimedLog("Client generation"):
-        client(config_dict)
+        ariadne_main.client(config_dict)
 
 
 def generate_queries():
     from graphpyshop.extensions.shopify_generate_queries import ShopifyQueryGenerator
 
-    load_dotenv(find_dotenv())
-
-    config_dict = get_config_dict()
-    settings = get_client_settings(config_dict)
+    _ensure_dotenv()
+    monkey_patch_httpx()
+    settings = _client_settings()
 
-    schema_path = f"{settings.target_package_path}/schema.graphql"
+    schema_path = os.path.join(settings.target_package_path, "schema.graphql")
 
-    logging.info(f"Looking for schema at {schema_path}")
+    logging.info("Looking for schema at %s", schema_path)
 
     if os.path.exists(schema_path):
-        logging.info(f"Schema found at {schema_path}")
+        logging.info("Schema found at %s", schema_path)
         settings.schema_path = schema_path
     else:
         logging.info("Schema not found, will write schema to file")
@@ -109,67 +185,129 @@ def generate_queries():
     query_generator.generate_queries()
 
 
+def _fast_rmtree(path: str):
+    """Remove a directory tree, using native rm where available
+
+    It's much faster than shutil.rmtree on large trees
+    """
+    if os.name == "posix" and shutil.which("rm"):
+        import subprocess  # noqa: PLC0415
+
+        subprocess.run(["rm", "-rf", path], check=True)
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _remove_if_exists(path: str):
+    import stat  # noqa: PLC0415
+
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if stat.S_ISDIR(st.st_mode):
+        _fast_rmtree(path)
+    else:
+        os.remove(path)
+
+
 def clean():
-    settings = get_client_settings(get_config_dict())
+    from concurrent.futures import ThreadPoolExecutor  # noqa: PLC0415
+
+    _ensure_dotenv()
+    settings = _client_settings()
+
+    package_path = settings.target_package_path
+    queries_path = settings.queries_path
 
     paths = [
-        f"{settings.target_package_path}/schema.graphql",
-        f"{settings.target_package_path}/{settings.target_package_name}",
-        f"{settings.queries_path}/lists",
-        f"{settings.queries_path}/objects",
+        os.path.join(package_path, "schema.graphql"),
+        os.path.join(package_path, settings.target_package_name),
+        os.path.join(queries_path, "lists"),
+        os.path.join(queries_path, "objects"),
     ]
-    for path in paths:
-        if os.path.exists(path):
-            if os.path.isfile(path):
-                os.remove(path)
-            else:
-                shutil.rmtree(path)
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        list(executor.map(_remove_if_exists, paths))
 
 
 def configure_logging():
-    log_config = {
-        "version": 1,
-        "disable_existing_loggers": False,
-        "formatters": {
-            "standard": {"format": "%(asctime)s [%(levelname)s] %(name)s: %(message)s"}
-        },
-        "handlers": {
-            "default": {
-                "level": "INFO",
-                "formatter": "standard",
-                "class": "logging.StreamHandler",
-            }
-        },
-        "loggers": {"": {"handlers": ["default"], "level": "INFO", "propagate": True}},
-    }
-    logging.config.dictConfig(log_config)
+    global _LOG_CONFIGURED
+    if _LOG_CONFIGURED:
+        return
+
+    logging.config.dictConfig(_LOG_CONFIG)
+    _LOG_CONFIGURED = True
+
+
+_COMMANDS = {
+    "generate-client": generate_client,
+    "generate-queries": generate_queries,
+    "clean": clean,
+}
+
+_USAGE = """usage: graphpyshop [-h] [--version] [--profile]
+                   {generate-client,generate-queries,clean}
+
+GraphPyShop CLI
+
+positional arguments:
+  {generate-client,generate-queries,clean}
+                        Command to run
+
+options:
+  -h, --help            show this help message and exit
+  --version             show program's version number and exit
+  --profile             Enable profiling"""
+
+
+def get_version() -> str:
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("GraphPyShop")
+    except PackageNotFoundError:
+        return "unknown"
 
 
 def main():
-    parser = argparse.ArgumentParser(description="GraphPyShop CLI")
+    # Answer help and version requests before building the parser
+    if len(sys.argv) <= 1 or sys.argv[1] in ("-h", "--help"):
+        print(_USAGE)
+        sys.exit(0)
+    if sys.argv[1] == "--version":
+        print(f"graphpyshop {get_version()}")
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(prog="graphpyshop", description="GraphPyShop CLI")
     parser.add_argument(
         "command",
-        choices=["generate-client", "generate-queries", "clean"],
+        choices=list(_COMMANDS),
         help="Command to run",
     )
+    parser.add_argument(
+        "--version", action="version", version=f"%(prog)s {get_version()}"
+    )
     parser.add_argument(
         "--profile",
         action="store_true",
         help="Enable profiling",
     )
     args = parser.parse_args()
+    import contextlib  # noqa: PLC0415
+
     configure_logging()
-    monkey_patch_httpx()
     monkeypatch_ariadne_codegen()
-    from graphpyshop.profiler import CallGrindProfiler
-
-    with CallGrindProfiler(f"Command {args.command}", enabled=args.profile):
-        if args.command == "generate-client":
-            generate_client()
-        elif args.command == "generate-queries":
-            generate_queries()
-        elif args.command == "clean":
-            clean()
+
+    profiler: contextlib.AbstractContextManager[None]
+    if args.profile:
+        from graphpyshop.profiler import CallGrindProfiler
+
+        profiler = CallGrindProfiler(f"Command {args.command}")
+    else:
+        profiler = contextlib.nullcontext()
+
+    with profiler:
+        _COMMANDS[args.command]()
 
 
 if __name__ == "__main__":
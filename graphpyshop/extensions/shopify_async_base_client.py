@@ -1,5 +1,7 @@
 import asyncio
 import base64
+import binascii
+import gzip
 import hashlib
 import hmac
 import json
@@ -7,32 +9,63 @@ import logging
 import re
 import time
 import importlib
+import weakref
 
+from collections import deque
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Union
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    get_args,
+)
 
 import httpx
+import orjson
 from ariadne_codegen.client_generators.dependencies.async_base_client import (
     AsyncBaseClient,
 )
+from ariadne_codegen.client_generators.dependencies.exceptions import (
+    GraphQLClientGraphQLMultiError,
+    GraphQLClientHttpError,
+    GraphQLClientInvalidResponseError,
+)
 from httpx import (
     AsyncHTTPTransport,
     Request,
     Response,
 )
-from pydantic import BaseModel
-
-
-class ThrottleStatus(BaseModel):
-    maximumAvailable: int
-    currentlyAvailable: int
-    restoreRate: int
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pydantic_core import to_jsonable_python
 
 
-class QueryCost(BaseModel):
+# Read for every request, so kept as a plain dataclass rather than a validated model
+@dataclass(slots=True)
+class QueryCost:
     requestedQueryCost: int
     actualQueryCost: int | None
-    throttleStatus: ThrottleStatus
+    currentlyAvailable: int
+
+    @classmethod
+    def from_extensions(cls, extensions: Dict[str, Any]) -> Optional["QueryCost"]:
+        cost = extensions.get("cost")
+        if not cost:
+            return None
+        throttle_status = cost.get("throttleStatus") or {}
+        return cls(
+            cost.get("requestedQueryCost", 0),
+            cost.get("actualQueryCost"),
+            throttle_status.get("currentlyAvailable", 0),
+        )
 
 
 class BulkOperationsFinish(BaseModel):
@@ -44,18 +77,132 @@ class BulkOperationsFinish(BaseModel):
     type: str
 
 
+def install_uvloop() -> bool:
+    """Make asyncio.run use uvloop, returning False if it isn't installed
+
+    Opt-in, as the event loop policy is process wide. A custom policy that is
+    already set is left alone.
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    if type(asyncio.get_event_loop_policy()) is asyncio.DefaultEventLoopPolicy:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
 def verify_webhook(data: bytes, hmac_header: str, secret: str) -> bool:
     digest = hmac.new(secret.encode("utf-8"), data, digestmod=hashlib.sha256).digest()
-    computed_hmac = base64.b64encode(digest)
+    try:
+        provided_digest = base64.b64decode(hmac_header, validate=True)
+    except (binascii.Error, ValueError):
+        # The header comes from the sender, a non-ASCII str raises ValueError
+        return False
+
+    return hmac.compare_digest(digest, provided_digest)
+
 
-    return hmac.compare_digest(computed_hmac, hmac_header.encode("utf-8"))
+_QUERY_NAME_RE = re.compile(r"query\s+(\w+)")
+_VARIABLE_DEFINITIONS_RE = re.compile(r"\(\$.*?\)")
+_VARIABLE_RE = re.compile(r"\$(\w+)")
 
 
 def parse_query_name(query: str) -> str:
-    match = re.search(r"query\s+(\w+)", query)
+    match = _QUERY_NAME_RE.search(query)
     return match.group(1) if match else "UnknownQuery"
 
 
+async def aiter_jsonl_lines(
+    response: Response, chunk_size: int = 64 * 1024
+) -> AsyncGenerator[bytes, None]:
+    """Yield non-empty lines of a JSONL response as bytes, without decoding to str"""
+    buffer = bytearray()
+    async for chunk in response.aiter_bytes(chunk_size):
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", start)) != -1:
+            if end > start:
+                yield bytes(buffer[start:end])
+            start = end + 1
+        del buffer[:start]
+    if buffer:
+        yield bytes(buffer)
+
+
+_list_adapters: Dict[Any, TypeAdapter[List[Any]]] = {}
+
+
+def get_list_adapter(model: Any) -> TypeAdapter[List[Any]]:
+    # Building an adapter compiles a validator, so keep one per model
+    adapter = _list_adapters.get(model)
+    if adapter is None:
+        adapter = _list_adapters[model] = TypeAdapter(List[model])
+    return adapter
+
+
+def iter_validated(model: Any, records: List[Dict[str, Any]]) -> Iterator[Any]:
+    """Validate records as one list, falling back to one at a time if any is invalid"""
+    try:
+        validated = get_list_adapter(model).validate_python(records)
+    except ValidationError:
+        # Records before the invalid one are still yielded before its error
+        for record in records:
+            yield model.model_validate(record)
+        return
+    yield from validated
+
+
+def _parse_jsonl_batch(lines: List[bytes]) -> List[Any]:
+    return [orjson.loads(line) for line in lines]
+
+
+async def aiter_jsonl_batches(
+    response: Response, batch_size: int = 1024
+) -> AsyncGenerator[List[Any], None]:
+    """Yield parsed JSONL records in batches, parsing in a worker thread while the next batch downloads"""
+    loop = asyncio.get_running_loop()
+    pending: Optional[asyncio.Future[List[Any]]] = None
+    batch: List[bytes] = []
+    async for line in aiter_jsonl_lines(response):
+        batch.append(line)
+        if len(batch) >= batch_size:
+            if pending is not None:
+                yield await pending
+            pending = loop.run_in_executor(None, _parse_jsonl_batch, batch)
+            batch = []
+    if pending is not None:
+        yield await pending
+    if batch:
+        yield _parse_jsonl_batch(batch)
+
+
+def get_model_fields(model: Any) -> Dict[str, Any]:
+    # Nothing may have been validated yet, so forward references in the
+    # annotations are resolved first; a no-op for models that are complete
+    model.model_rebuild()
+    return model.model_fields
+
+
+def get_connection_fields(model: Any) -> List[Tuple[str, Optional[str]]]:
+    """Return (field key, node typename) for every connection field of a generated model"""
+    fields: List[Tuple[str, Optional[str]]] = []
+    for field_name, field in get_model_fields(model).items():
+        annotation = field.annotation
+        if not (
+            isinstance(annotation, type)
+            and issubclass(annotation, BaseModel)
+            and "edges" in get_model_fields(annotation)
+        ):
+            continue
+        edge_class = get_args(annotation.model_fields["edges"].annotation)[0]
+        node_class = get_model_fields(edge_class)["node"].annotation
+        typename_field = get_model_fields(node_class).get("typename__")
+        literals = get_args(typename_field.annotation) if typename_field else ()
+        fields.append((field.alias or field_name, literals[0] if literals else None))
+    return fields
+
+
 class AsyncLimiterError(Exception):
     pass
 
@@ -63,25 +210,37 @@ class AsyncLimiterError(Exception):
 class AsyncLimiterTransport(AsyncHTTPTransport):
     MAX_RETRIES = 10
     TOTAL_CAPACITY = 20000
-    RESTORE_RATE = 1000  # points per 1000ms
+    RESTORE_RATE = 1000  # points per second
     BACKOFF_FACTOR = 3
 
     def __init__(self):
-        super().__init__()
-        self.current_capacity = self.TOTAL_CAPACITY
-        self.capacity_lock = asyncio.Lock()
-        self.capacity_event = asyncio.Event()
+        # The client's http2 flag and limits are ignored when a transport is
+        # passed in, so the pool is configured here
+        super().__init__(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=64, max_keepalive_connections=32, keepalive_expiry=60
+            ),
+        )
+        # All capacity bookkeeping happens between awaits on the event loop,
+        # so it's atomic without a lock
+        self.current_capacity: float = self.TOTAL_CAPACITY
+        self.last_refill = time.monotonic()
+        self.waiters: Deque[Tuple[int, asyncio.Future[None]]] = deque()
+        self.wakeup_handle: Optional[asyncio.TimerHandle] = None
+        self.wakeup_loop: Optional[asyncio.AbstractEventLoop] = None
         self.request_counter = 0
 
-    async def _add_capacity_task(self):
-        while True:
-            await asyncio.sleep(0.01)  # 10ms
-            await self.add_capacity(10)
+    def _refill(self):
+        # Restore capacity for the time passed since the last refill
+        now = time.monotonic()
+        restored = (now - self.last_refill) * self.RESTORE_RATE
+        self.current_capacity = min(
+            self.TOTAL_CAPACITY, self.current_capacity + restored
+        )
+        self.last_refill = now
 
     async def handle_async_request(self, request: Request) -> Response:
-        if not hasattr(self, "_capacity_task"):
-            self._capacity_task = asyncio.create_task(self._add_capacity_task())
-
         retries = self.MAX_RETRIES
 
         starting_query_cost = 1000
@@ -102,7 +261,7 @@ class AsyncLimiterTransport(AsyncHTTPTransport):
 
                     # We got throttled, sync costs with server and retry
                     await self.sync_with_server(
-                        cost.throttleStatus.currentlyAvailable, request_id
+                        cost.currentlyAvailable, request_id
                     )
                     log_message = f"Request {request_id}: Retry {self.MAX_RETRIES - retries + 1} of {self.MAX_RETRIES} at cost {requested_query_cost} due to throttling. Current capacity: {self.current_capacity}"
                     if retries > self.MAX_RETRIES / 2:
@@ -122,8 +281,8 @@ class AsyncLimiterTransport(AsyncHTTPTransport):
                     continue
                 else:
                     # Return the unused cost to bucket, actually incurred cost needs to be recovered via restore rate over time
-                    await self.add_capacity(
-                        starting_query_cost - cost.actualQueryCost, request_id
+                    self._return_capacity(
+                        starting_query_cost - cost.actualQueryCost
                     )
 
             return response
@@ -134,64 +293,159 @@ class AsyncLimiterTransport(AsyncHTTPTransport):
         logging.debug(
             f"Request {request_id}: Attempting to ensure capacity for cost: {requested_query_cost}. Current capacity: {self.current_capacity}"
         )
-        while True:
-            async with self.capacity_lock:
-                if self.current_capacity >= requested_query_cost:
-                    logging.debug(
-                        f"Request {request_id}: Current capacity ({self.current_capacity}) is sufficient for the requested cost ({requested_query_cost})."
-                    )
-                    self.current_capacity -= requested_query_cost
-                    return True
-                else:
-                    logging.debug(
-                        f"Request {request_id}: Current capacity ({self.current_capacity}) is not sufficient for the requested cost ({requested_query_cost}). Waiting for capacity to be restored."
-                    )
-            await (
-                self.capacity_event.wait()
-            )  # Wait until notified that capacity is restored
-            self.capacity_event.clear()  # Clear the event after waking up
-
-    async def add_capacity(self, amount_to_add: int, request_id: int | None = None):
-        async with self.capacity_lock:
-            if self.current_capacity < self.TOTAL_CAPACITY:
-                self.current_capacity += min(
-                    amount_to_add, self.TOTAL_CAPACITY - self.current_capacity
-                )
-                capacity_was_increased = True
-            else:
-                capacity_was_increased = False
-
-        if capacity_was_increased:
-            # Do this outside the lock
+        self._refill()
+        # Waiters cancelled at the head of the queue don't hold up the fast path
+        while self.waiters and self.waiters[0][1].done():
+            self.waiters.popleft()
+        # Queue behind existing waiters so large requests aren't starved
+        if not self.waiters and self.current_capacity >= requested_query_cost:
             logging.debug(
-                f"Request {request_id}: Increased capacity by {amount_to_add} to {self.current_capacity}"
+                f"Request {request_id}: Current capacity ({self.current_capacity}) is sufficient for the requested cost ({requested_query_cost})."
             )
-            self.capacity_event.set()  # Notify waiting tasks that capacity has been restored
+            self.current_capacity -= requested_query_cost
+            return True
 
-    async def sync_with_server(self, server_currently_available: int, request_id: int):
-        async with self.capacity_lock:
-            self.current_capacity = server_currently_available
+        logging.debug(
+            f"Request {request_id}: Current capacity ({self.current_capacity}) is not sufficient for the requested cost ({requested_query_cost}). Waiting for capacity to be restored."
+        )
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self.waiters.append((requested_query_cost, waiter))
+        self._schedule_wakeup()
+        try:
+            # Capacity is deducted by _release_waiters before the waiter is resolved
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._return_capacity(requested_query_cost)
+            raise
+        return True
+
+    def _release_waiters(self):
+        if self.wakeup_handle is not None:
+            self.wakeup_handle.cancel()
+            self.wakeup_handle = None
+
+        self._refill()
+        while self.waiters:
+            requested_query_cost, waiter = self.waiters[0]
+            if waiter.done():
+                # Cancelled while waiting
+                self.waiters.popleft()
+                continue
+            if self.current_capacity < requested_query_cost:
+                break
+            self.waiters.popleft()
+            self.current_capacity -= requested_query_cost
+            waiter.set_result(None)
+        self._schedule_wakeup()
+
+    def _schedule_wakeup(self):
+        loop = asyncio.get_running_loop()
+        if self.wakeup_handle is not None and (
+            self.wakeup_handle.cancelled() or self.wakeup_loop is not loop
+        ):
+            # Left over from a loop that has since ended, e.g. an earlier asyncio.run
+            self.wakeup_handle.cancel()
+            self.wakeup_handle = None
+        # Wake up when the restore rate will have covered the first waiter's cost
+        if self.wakeup_handle is not None or not self.waiters:
+            return
+        deficit = self.waiters[0][0] - self.current_capacity
+        self.wakeup_handle = loop.call_later(
+            max(deficit, 0) / self.RESTORE_RATE, self._wakeup
+        )
+        self.wakeup_loop = loop
 
-        # Do this outside the lock
+    def _wakeup(self):
+        self.wakeup_handle = None
+        self._release_waiters()
+
+    def _return_capacity(self, amount: float):
+        self._refill()
+        self.current_capacity = min(
+            self.TOTAL_CAPACITY, self.current_capacity + amount
+        )
+        if self.waiters:
+            self._release_waiters()
+
+    async def sync_with_server(self, server_currently_available: int, request_id: int):
+        self.current_capacity = server_currently_available
+        self.last_refill = time.monotonic()
         logging.debug(
             f"Request {request_id}: Synced capacity with server to {self.current_capacity}"
         )
-        self.capacity_event.set()  # Notify waiting tasks that capacity has been restored
+        if self.waiters:
+            self._release_waiters()
 
     async def _get_query_cost(self, response: httpx.Response, request_id: int):
         try:
             await response.aread()
-            response_json = response.json()
-            throttle_status = QueryCost.model_validate(
-                response_json.get("extensions", {}).get("cost", {})
-            )
-            return throttle_status
-        except json.JSONDecodeError:
+            response_json = orjson.loads(response.content)
+            # Let get_data reuse the parsed body instead of decoding it again
+            response.extensions["parsed_json"] = response_json
+            if not isinstance(response_json, dict):
+                return None
+            return QueryCost.from_extensions(response_json.get("extensions") or {})
+        except orjson.JSONDecodeError:
             return None
 
 
+class CompressingLimiterTransport(AsyncLimiterTransport):
+    """Rate limited transport that gzips larger request bodies, e.g. long bulk mutations"""
+
+    MIN_COMPRESS_SIZE = 1024
+
+    async def handle_async_request(self, request: Request) -> Response:
+        try:
+            content = request.content
+        except httpx.RequestNotRead:
+            # Streaming bodies are sent as is
+            return await super().handle_async_request(request)
+
+        if len(content) > self.MIN_COMPRESS_SIZE and "content-encoding" not in request.headers:
+            headers = request.headers.copy()
+            del headers["content-length"]
+            headers["content-encoding"] = "gzip"
+            # Level 1 is cheap and still shrinks GraphQL text several times
+            request = Request(
+                request.method,
+                request.url,
+                headers=headers,
+                content=gzip.compress(content, compresslevel=1),
+                extensions=request.extensions,
+            )
+        return await super().handle_async_request(request)
+
+
 global_transport = AsyncLimiterTransport()
 
+# Connections are bound to the loop that opened them, so each loop gets its own
+# client and loops closed by asyncio.run drop theirs when collected
+_jsonl_clients: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, httpx.AsyncClient
+] = weakref.WeakKeyDictionary()
+
+
+def get_jsonl_client() -> httpx.AsyncClient:
+    # Bulk results are served from signed storage URLs on another host, so they
+    # get their own client with long reads and long lived keepalive connections
+    loop = asyncio.get_running_loop()
+    client = _jsonl_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _jsonl_clients[loop] = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=300),
+            timeout=httpx.Timeout(connect=10, read=300, write=10, pool=10),
+        )
+    return client
+
+
+async def aclose_http_clients():
+    """Close the bulk results client of the running loop, e.g. before it ends"""
+    client = _jsonl_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
 
 class ShopifyGetDataError(Exception):
     pass
@@ -199,12 +453,18 @@ class ShopifyGetDataError(Exception):
 
 class ShopifyAsyncBaseClient(AsyncBaseClient):
     BULK_QUERY_TRY_START_TIMEOUT = 600
+    BULK_POLL_MIN_INTERVAL = 0.5
+    BULK_POLL_MAX_INTERVAL = 2
+    BULK_POLL_BACKOFF_FACTOR = 1.5
+    JSONL_VALIDATE_BATCH_SIZE = 1024
 
     def __init__(
         self, url: str, access_token: str, transport: AsyncHTTPTransport | None = None
     ):
         if transport is None:
             transport = global_transport
+        # Connections are pooled by the shared transport, so each instance can
+        # own its client and close it on __aexit__ without affecting others
         super().__init__(
             url=url,
             http_client=httpx.AsyncClient(
@@ -217,37 +477,64 @@ class ShopifyAsyncBaseClient(AsyncBaseClient):
         )
 
     def get_data(self, response: httpx.Response) -> Dict[str, Any]:
-        data = super().get_data(response)
-
-        # Find userErrors in any part of the response
-        user_errors = None
-        for value in data.values():
-            if isinstance(value, dict) and "userErrors" in value:
-                user_errors = value["userErrors"]
-                break
+        data = self._get_graphql_data(response)
+
+        # Find the first non-empty userErrors among the top level fields
+        user_errors = next(
+            (
+                value["userErrors"]
+                for value in data.values()
+                if isinstance(value, dict) and value.get("userErrors")
+            ),
+            None,
+        )
 
         if user_errors:
             error_details = ", ".join(
-                [
-                    f"{', '.join(error.get('field') or ['Unknown field'])}: {error.get('message', 'Unknown error')}"
-                    for error in user_errors
-                ]
+                f"{', '.join(error.get('field') or ['Unknown field'])}: {error.get('message', 'Unknown error')}"
+                for error in user_errors
             )
             raise ShopifyGetDataError(error_details)
 
         return data
 
+    def _get_graphql_data(self, response: httpx.Response) -> Dict[str, Any]:
+        response_json = response.extensions.get("parsed_json")
+        if response_json is None:
+            return super().get_data(response)
+
+        # Same checks as AsyncBaseClient.get_data, on the body parsed by the transport
+        if not response.is_success:
+            raise GraphQLClientHttpError(
+                status_code=response.status_code, response=response
+            )
+        if not isinstance(response_json, dict) or (
+            "data" not in response_json and "errors" not in response_json
+        ):
+            raise GraphQLClientInvalidResponseError(response=response)
+
+        data = response_json.get("data")
+        errors = response_json.get("errors")
+        if errors:
+            raise GraphQLClientGraphQLMultiError.from_errors_dicts(
+                errors_dicts=errors, data=data
+            )
+        return data
+
     def inject_variables(self, query: str, variables: dict[str, object]) -> str:
         # Remove variables and parentheses from the top level query
-        query = re.sub(r"\(\$.*?\)", "", query)
-        # Replace variables in the query
-        for key, value in variables.items():
-            if isinstance(value, str):
-                query = query.replace(f"${key}", f'"{value}"')
-            else:
-                query = query.replace(f"${key}", str(value))
+        query = _VARIABLE_DEFINITIONS_RE.sub("", query)
 
-        return query
+        # Replace variables in the query, JSON encoding gives valid GraphQL literals
+        # for strings (escaped quotes), booleans and nulls, and other values are
+        # converted the way AsyncBaseClient serializes variables of normal requests
+        def replace(match: re.Match[str]) -> str:
+            key = match.group(1)
+            if key not in variables:
+                return match.group(0)
+            return json.dumps(variables[key], default=to_jsonable_python)
+
+        return _VARIABLE_RE.sub(replace, query)
 
     async def try_create_bulk_query(
         self,
@@ -286,25 +573,36 @@ class ShopifyAsyncBaseClient(AsyncBaseClient):
     def flatten_gql_response(
         self, json_data: Union[Dict[str, Any], List[Any], Any]
     ) -> Union[List[Any], Dict[str, Any], Any]:
-        if isinstance(json_data, dict):
-            if "edges" in json_data:
-                # Extract the list of nodes from the edges
-                return [
-                    self.flatten_gql_response(item["node"])
-                    for item in json_data["edges"]
-                ]
+        # Iterative to avoid a Python call per node and recursion limits on deep payloads,
+        # each stack entry is (target container, key in target, source value)
+        root: List[Any] = [None]
+        stack: List[Tuple[Any, Any, Any]] = [(root, 0, json_data)]
+        while stack:
+            target, target_key, value = stack.pop()
+            children: Any
+            if isinstance(value, dict):
+                if "edges" in value:
+                    # Extract the list of nodes from the edges
+                    children = enumerate(edge["node"] for edge in value["edges"])
+                    result: Any = [None] * len(value["edges"])
+                else:
+                    children = value.items()
+                    result = dict.fromkeys(value)
+            elif isinstance(value, list):
+                children = enumerate(value)
+                result = [None] * len(value)
             else:
-                # Recursively apply flattening to each dictionary entry
-                return {
-                    key: self.flatten_gql_response(value)
-                    for key, value in json_data.items()
-                }
-        elif isinstance(json_data, list):
-            # Apply flattening to each item in the list
-            return [self.flatten_gql_response(item) for item in json_data]
-        else:
-            # Return the item itself if it's neither a dict nor a list
-            return json_data
+                # Return the item itself if it's neither a dict nor a list
+                target[target_key] = value
+                continue
+
+            target[target_key] = result
+            for key, child in children:
+                if isinstance(child, (dict, list)):
+                    stack.append((result, key, child))
+                else:
+                    result[key] = child
+        return root[0]
 
     async def run_bulk_operation(
         self,
@@ -322,18 +620,21 @@ class ShopifyAsyncBaseClient(AsyncBaseClient):
         )
         if response and response.bulk_operation:
             status = response.bulk_operation.status
+            # Check short jobs again quickly, backing off for long running ones
+            poll_interval = self.BULK_POLL_MIN_INTERVAL
             while status in [
                 bulk_operation_status.CREATED,
                 bulk_operation_status.RUNNING,
                 bulk_operation_status.CANCELING,
             ]:
-                await asyncio.sleep(2)  # Wait before checking the status again
+                await asyncio.sleep(poll_interval)  # Wait before checking the status again
+                poll_interval = min(
+                    poll_interval * self.BULK_POLL_BACKOFF_FACTOR,
+                    self.BULK_POLL_MAX_INTERVAL,
+                )
                 status_response = await check_callable(response.bulk_operation.id)
                 current_time = datetime.now(timezone.utc)
-                created_at_datetime = datetime.fromisoformat(
-                    status_response.created_at.replace("Z", "+00:00")
-                )
-                running_duration = current_time - created_at_datetime
+                running_duration = current_time - status_response.created_at
                 object_count = float(
                     status_response.object_count
                 )  # Ensure object_count is a float
@@ -366,52 +667,86 @@ class ShopifyAsyncBaseClient(AsyncBaseClient):
 
     # TODO: Refactor this to automatically detect types from jsonl and stitch connections together
     async def get_jsonl(self, url: str, typename_to_class_map: Dict[str, str]):
-        parent_objects: dict[str, Any] = {}
-        last_parent_id = None
+        # Bulk JSONL lists each parent followed by its children, so only the latest
+        # parent is kept, along with handles to its connection edge lists
+        current_parent: Optional[Dict[str, Any]] = None
+        current_parent_id = None
+        current_edges: Dict[str, List[Any]] = {}
         missing_fields: dict[str, str] = {}
 
-        async with httpx.AsyncClient() as client, client.stream("GET", url) as response:
+        # Resolve classes and their connection fields once per typename, not per record
+        module = importlib.import_module("graphpyshop.client")
+        classes: dict[str, Any] = {}
+        connection_fields: dict[str, List[str]] = {}
+
+        def get_class(typename: str) -> Any:
+            class_ = classes.get(typename)
+            if class_ is None:
+                class_ = getattr(module, typename_to_class_map[typename])
+                classes[typename] = class_
+            return class_
+
+        # Completed parents are validated in batches of one class at a time
+        batch_class: Any = None
+        batch: List[Dict[str, Any]] = []
+
+        async with get_jsonl_client().stream("GET", url) as response:
             response.raise_for_status()
-            async for line in response.aiter_lines():
-                parsed_line = json.loads(line)
-                if "__parentId" in parsed_line:
-                    parent_id = parsed_line.pop("__parentId")  # Remove __parentId from the record
-                    logging.debug(f"Found child with parent ID: {parent_id}")
-                    if parent_id in parent_objects:
-                        parent = parent_objects[parent_id]
-                        logging.debug(f"Parent found for ID {parent_id}")
-                        parent_field = missing_fields.get(parsed_line["__typename"])
-                        if parent_field:
-                            logging.debug(f"Type match found for {parsed_line['__typename']} under attribute {parent_field}")
-                            parent[parent_field]["edges"].append({"node": parsed_line})
-                            logging.debug(f"Child appended to parent under {parent_field}.")
+            async for records in aiter_jsonl_batches(response):
+                for parsed_line in records:
+                    parent_id = parsed_line.pop("__parentId", None)  # Remove __parentId from the record
+                    if parent_id is not None:
+                        if parent_id != current_parent_id:
+                            continue
+                        typename = parsed_line["__typename"]
+                        parent_field = missing_fields.get(typename)
+                        edges = current_edges.get(parent_field) if parent_field else None
+                        if edges is not None:
+                            edges.append({"node": parsed_line})
                         else:
-                            logging.warning(f"No matching field found for {parsed_line['__typename']} in missing_fields.")
-                else:
-                    if last_parent_id is not None and last_parent_id in parent_objects:
-                        class_name = typename_to_class_map[parent_objects[last_parent_id]["__typename"]]
-                        module = importlib.import_module("graphpyshop.client")
-                        class_ = getattr(module, class_name)
-                        yield class_.model_validate(parent_objects[last_parent_id])
-                        del parent_objects[last_parent_id]  # Free memory
-
-                    new_parent = parsed_line.copy()
-                    for field_name, field in return_type.__fields__.items():
-                        field_key = field.alias or field_name
-                        if field_key not in new_parent:
-                            new_parent[field_key] = {"edges": []}
-                            node_class = field.annotation.__fields__["edges"].annotation.__args__[0].__fields__["node"].annotation
-                            node_class_literal = node_class.schema()["properties"]["__typename"]["const"]
-                            logging.debug(f"Node class for field '{field_key}': {node_class_literal}")
-                            if node_class_literal:
-                                missing_fields[node_class_literal] = field_key
-
-                    parent_objects[parsed_line["id"]] = new_parent
-                    last_parent_id = parsed_line["id"]
-
-        if last_parent_id is not None and last_parent_id in parent_objects:
-            class_name = typename_to_class_map[parent_objects[last_parent_id]["__typename"]]
-            module = importlib.import_module("graphpyshop.client")
-            class_ = getattr(module, class_name)
-            yield class_.model_validate(parent_objects[last_parent_id])
+                            logging.warning(f"No matching field found for {typename} in missing_fields.")
+                        continue
+
+                    if current_parent is not None:
+                        class_ = get_class(current_parent["__typename"])
+                        if batch and (class_ is not batch_class or len(batch) >= self.JSONL_VALIDATE_BATCH_SIZE):
+                            for item in iter_validated(batch_class, batch):
+                                yield item
+                            batch = []
+                        batch_class = class_
+                        batch.append(current_parent)
+
+                    typename = parsed_line["__typename"]
+                    fields = connection_fields.get(typename)
+                    if fields is None:
+                        fields = []
+                        for field_key, node_typename in get_connection_fields(get_class(typename)):
+                            logging.debug(f"Node class for field '{field_key}': {node_typename}")
+                            if node_typename:
+                                missing_fields[node_typename] = field_key
+                            fields.append(field_key)
+                        connection_fields[typename] = fields
+
+                    current_edges = {}
+                    for field_key in fields:
+                        connection = parsed_line.get(field_key)
+                        if connection is None:
+                            connection = parsed_line[field_key] = {"edges": []}
+                        current_edges[field_key] = connection.setdefault("edges", [])
+
+                    current_parent = parsed_line
+                    current_parent_id = parsed_line["id"]
+
+        if current_parent is not None:
+            class_ = get_class(current_parent["__typename"])
+            if batch and class_ is not batch_class:
+                for item in iter_validated(batch_class, batch):
+                    yield item
+                batch = []
+            batch_class = class_
+            batch.append(current_parent)
             logging.debug(f"Missing fields: {missing_fields}")
+
+        if batch:
+            for item in iter_validated(batch_class, batch):
+                yield item
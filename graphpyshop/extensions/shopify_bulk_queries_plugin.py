@@ -1,48 +1,162 @@
 import ast
+import copy
 import logging
-from typing import Any, Dict, List, Optional, Set, Tuple
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    DefaultDict,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from ariadne_codegen.plugins.base import Plugin
-from graphql import GraphQLSchema
+from graphql import GraphQLSchema, OperationDefinitionNode, SelectionSetNode
+
+_LAZY_INIT_TEMPLATE = """
+def __getattr__(name: str) -> Any:
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __package__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted({*globals(), *_LAZY_IMPORTS})
+"""
+
+
+# Expression contexts carry no state, so generated nodes can all share these
+_LOAD = ast.Load()
+_STORE = ast.Store()
+
+
+def _iter_statements(body: List[ast.stmt]) -> Iterator[ast.stmt]:
+    # Module level statements, including those under if/try blocks such as
+    # TYPE_CHECKING, without descending into classes, functions or expressions
+    for stmt in body:
+        yield stmt
+        if isinstance(stmt, ast.If):
+            yield from _iter_statements(stmt.body)
+            yield from _iter_statements(stmt.orelse)
+        elif isinstance(stmt, ast.Try):
+            yield from _iter_statements(stmt.body)
+            for handler in stmt.handlers:
+                yield from _iter_statements(handler.body)
+            yield from _iter_statements(stmt.orelse)
+            yield from _iter_statements(stmt.finalbody)
+
+
+def _client_module_path(module_name: str) -> str:
+    # Relative names like ".enums" resolve to the same file as "enums"
+    return os.path.join("graphpyshop", "client", *module_name.split(".")) + ".py"
+
+
+@dataclass
+class ModuleInfo:
+    """What the plugin needs from a generated module, collected in one pass"""
+
+    module: ast.Module
+    classes_by_name: Dict[str, ast.ClassDef] = field(default_factory=dict)
+    typename_to_class_map: Dict[str, str] = field(default_factory=dict)
+    # Connection class name -> annotation of its edges' node field
+    edges_node_types: Dict[str, ast.expr] = field(default_factory=dict)
 
 
 class ShopifyBulkQueriesPlugin(Plugin):
-    _ignore_args: set[str] = set()
-    _ignore_args_full = {"self", *_ignore_args}
-    _typename_to_class_map: Dict[str, Dict[str, str]] = {}
+    _ignore_args: frozenset[str] = frozenset()
+    _ignore_args_full = frozenset({"self", *_ignore_args})
 
     def __init__(self, schema: GraphQLSchema, config_dict: Dict[str, Any]) -> None:
         super().__init__(schema=schema, config_dict=config_dict)
-        self.pending_imports: Dict[str, Set[Tuple[str, bool]]] = (
-            {}
+        self.pending_imports: DefaultDict[str, Set[Tuple[str, bool]]] = defaultdict(
+            set
         )  # Initialize pending imports
+        # Scanned generated modules keyed by absolute path, with the mtime they were parsed at
+        self._module_cache: Dict[str, Tuple[float, ModuleInfo]] = {}
+        self._unreadable_modules: Set[str] = set()
+        self._symbol_modules: Dict[str, str] = {}
+        self._typename_items_cache: Dict[str, List[Tuple[str, str]]] = {}
+        self._list_return_types: Dict[
+            Tuple[str, bool], Optional[Tuple[ast.expr, str]]
+        ] = {}
         logging.info("ShopifyBulkQueriesPlugin initialized with schema and config.")
 
-    def get_typename_to_class_map(self, module_name: str) -> Dict[str, str]:
-        if module_name in self._typename_to_class_map:
-            return self._typename_to_class_map[module_name]
-
-        module_path = f"graphpyshop/client/{module_name.replace('.', '/')}.py"
+    def _load_module(self, module_path: str) -> Optional[ModuleInfo]:
+        # abspath also normalizes, so "client//enums.py" and "client/enums.py" share an entry
+        path = os.path.abspath(module_path)
+        if path in self._unreadable_modules:
+            return None
         try:
-            with open(module_path, "r") as file:
-                module_source = file.read()
-            module_ast = ast.parse(module_source)
-        except (FileNotFoundError, OSError) as e:
-            logging.error(f"Failed to read module {module_name}: {e}")
-            return {}
-
-        typename_to_class_map: Dict[str, str] = {}
-        for node in ast.walk(module_ast):
-            if isinstance(node, ast.ClassDef):
-                typename_literal = self._extract_typename_literal(node)
-                if typename_literal:
-                    typename_to_class_map[typename_literal] = node.name
+            mtime = os.stat(path).st_mtime
+            cached = self._module_cache.get(path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+            # ast.parse takes bytes directly and handles decoding itself
+            with open(path, "rb") as file:
+                source = file.read()
+        except OSError as e:
+            logging.error(f"Failed to read module {path}: {e}")
+            self._unreadable_modules.add(path)
+            return None
+
+        module_info = self._scan_module(ast.parse(source, filename=path))
+        self._module_cache[path] = (mtime, module_info)
+        return module_info
+
+    def _scan_module(self, module_ast: ast.Module) -> ModuleInfo:
+        module_info = ModuleInfo(module=module_ast)
+        edges_class_names: Dict[str, str] = {}
+        for node in _iter_statements(module_ast.body):
+            if not isinstance(node, ast.ClassDef):
+                continue
+            module_info.classes_by_name[node.name] = node
+            typename_literal = self._extract_typename_literal(node)
+            if typename_literal:
+                module_info.typename_to_class_map[typename_literal] = node.name
+            for stmt in node.body:
+                if (
+                    isinstance(stmt, ast.AnnAssign)
+                    and isinstance(stmt.annotation, ast.Subscript)
+                    and isinstance(stmt.target, ast.Name)
+                    and stmt.target.id == "edges"
+                    and isinstance(stmt.annotation.value, ast.Name)
+                    and stmt.annotation.value.id == "List"
+                    and isinstance(stmt.annotation.slice, ast.Constant)
+                    and stmt.annotation.slice.value
+                ):
+                    edges_class_names[node.name] = stmt.annotation.slice.value
+
+        for class_name, edges_class_name in edges_class_names.items():
+            edges_class = module_info.classes_by_name.get(edges_class_name)
+            if edges_class is None:
+                continue
+            for stmt in edges_class.body:
+                if (
+                    isinstance(stmt, ast.AnnAssign)
+                    and isinstance(stmt.target, ast.Name)
+                    and stmt.target.id == "node"
+                ):
+                    module_info.edges_node_types[class_name] = stmt.annotation
+                    break
+        return module_info
 
-        self._typename_to_class_map[module_name] = typename_to_class_map
-        return typename_to_class_map
+    def get_typename_to_class_map(self, module_name: str) -> Dict[str, str]:
+        module_info = self._load_module(_client_module_path(module_name))
+        return module_info.typename_to_class_map if module_info else {}
 
     def _extract_typename_literal(self, class_node: ast.ClassDef) -> Optional[str]:
-        for node in ast.walk(class_node):
+        # typename__ is always declared directly in the class body
+        for node in class_node.body:
             if (
                 isinstance(node, ast.AnnAssign)
                 and isinstance(node.target, ast.Name)
@@ -57,185 +171,265 @@ class ShopifyBulkQueriesPlugin(Plugin):
                         return node.annotation.slice.value
         return None
 
+    def generate_init_module(self, module: ast.Module) -> ast.Module:
+        """Resolve package exports on first access instead of importing every generated module"""
+        lazy_imports: Dict[str, str] = {}
+        eager_imports: List[ast.stmt] = []
+        body: List[ast.stmt] = []
+        for stmt in module.body:
+            if isinstance(stmt, ast.ImportFrom):
+                from_ = "." * stmt.level + (stmt.module or "")
+                if from_.startswith("."):
+                    for alias in stmt.names:
+                        lazy_imports[alias.asname or alias.name] = from_
+                    eager_imports.append(stmt)
+                    continue
+            body.append(stmt)
+
+        if not lazy_imports:
+            return module
+
+        header = ast.parse(
+            "import importlib\nfrom typing import TYPE_CHECKING, Any, List\n"
+        ).body
+        type_checking = ast.If(
+            test=ast.Name(id="TYPE_CHECKING", ctx=_LOAD),
+            body=eager_imports,
+            orelse=[],
+        )
+        lazy_imports_assign = ast.Assign(
+            targets=[ast.Name(id="_LAZY_IMPORTS", ctx=_STORE)],
+            value=ast.Dict(
+                keys=[ast.Constant(value=name) for name in lazy_imports],
+                values=[ast.Constant(value=from_) for from_ in lazy_imports.values()],
+            ),
+        )
+        module.body = [
+            *header,
+            type_checking,
+            *body,
+            lazy_imports_assign,
+            *ast.parse(_LAZY_INIT_TEMPLATE).body,
+        ]
+        ast.fix_missing_locations(module)
+        return module
+
     def generate_client_module(self, module: ast.Module) -> ast.Module:
         logging.info("Starting to generate client module.")
+        # Return types are resolved against this module's imports
+        self._list_return_types = {}
+        self._symbol_modules = self._build_symbol_table(module)
+        new_nodes: List[ast.AST] = []
         for node in module.body:
             if isinstance(node, ast.ClassDef):
                 logging.info(f"Examining class: {node.name}")
-                new_methods = self._enhance_class_with_bulk_methods(node, module)
+                new_methods = self._enhance_class_with_bulk_methods(node)
                 node.body.extend(new_methods)  # Append new methods after collecting all
+                new_nodes.extend(new_methods)
+
+        if not new_nodes:
+            # No bulk methods were added, so no imports are needed for them
+            self.pending_imports.clear()
+            return module
+
+        runtime_imports, all_imports = self._collect_existing_imports(module)
+        self._add_necessary_imports(runtime_imports)
+        new_nodes.extend(
+            self._flush_pending_imports(module, runtime_imports, all_imports)
+        )  # Ensure all pending imports are added
+
+        # Only the added nodes lack locations, no need to walk the whole client
+        for node in new_nodes:
+            ast.fix_missing_locations(node)
+        return module
 
-        self._add_necessary_imports(module)
-        self._flush_pending_imports(module)  # Ensure all pending imports are added
-        ast.fix_missing_locations(module)
+    def generate_result_types_module(
+        self, module: ast.Module, operation_definition: OperationDefinitionNode
+    ) -> ast.Module:
+        # Result classes get a model_config, make sure ConfigDict is importable
+        module.body.insert(
+            0,
+            ast.ImportFrom(
+                module="pydantic",
+                names=[ast.alias(name="ConfigDict", asname=None)],
+                level=0,
+            ),
+        )
         return module
 
-    def _add_necessary_imports(self, module: ast.Module):
-        # Ensure AsyncGenerator from typing is always imported
-        if not any(
-            isinstance(stmt, ast.ImportFrom)
-            and stmt.module == "typing"
-            and any(
-                isinstance(alias, ast.alias) and alias.name == "AsyncGenerator"
-                for alias in stmt.names
-            )
-            for stmt in module.body
-        ):
-            self._add_import("AsyncGenerator", "typing", False)
-
-        # Ensure BulkOperationStatus from .enums is always imported
-        if not any(
-            isinstance(stmt, ast.ImportFrom)
-            and stmt.module == ".enums"
-            and any(
-                isinstance(alias, ast.alias) and alias.name == "BulkOperationStatus"
+    def generate_result_class(
+        self,
+        class_def: ast.ClassDef,
+        operation_definition: OperationDefinitionNode,
+        selection_set: SelectionSetNode,
+    ) -> ast.ClassDef:
+        # Result models are read-only snapshots of Shopify data, freezing them
+        # lets pydantic skip assignment validation and keeps instances lean
+        # when bulk operations yield large numbers of them
+        class_def.body.insert(
+            0,
+            ast.Assign(
+                targets=[ast.Name(id="model_config", ctx=_STORE)],
+                value=ast.Call(
+                    func=ast.Name(id="ConfigDict", ctx=_LOAD),
+                    args=[],
+                    keywords=[
+                        ast.keyword(arg="extra", value=ast.Constant(value="ignore")),
+                        ast.keyword(arg="frozen", value=ast.Constant(value=True)),
+                    ],
+                ),
+            ),
+        )
+        return class_def
+
+    def _build_symbol_table(self, module: ast.Module) -> Dict[str, str]:
+        # Name -> generated module it's imported from, the first import wins
+        symbol_modules: Dict[str, str] = {}
+        for node in _iter_statements(module.body):
+            if not isinstance(node, ast.ImportFrom) or not node.module:
+                continue
+            for alias in node.names:
+                symbol_modules.setdefault(alias.name, node.module)
+        return symbol_modules
+
+    def _collect_existing_imports(
+        self, module: ast.Module
+    ) -> Tuple[Set[Tuple[str, str]], Set[Tuple[str, str]]]:
+        # Only top level imports exist at runtime, the rest, e.g. those under
+        # TYPE_CHECKING, can only stand in for imports needed by annotations
+        def import_keys(stmts: Iterable[ast.stmt]) -> Set[Tuple[str, str]]:
+            return {
+                ("." * stmt.level + (stmt.module or ""), alias.name)
+                for stmt in stmts
+                if isinstance(stmt, ast.ImportFrom)
                 for alias in stmt.names
-            )
-            for stmt in module.body
+            }
+
+        return import_keys(module.body), import_keys(_iter_statements(module.body))
+
+    def _add_necessary_imports(self, runtime_imports: Set[Tuple[str, str]]):
+        # The bulk methods use these at runtime, each one is checked on its own
+        for name, module_name in (
+            ("AsyncGenerator", "typing"),
+            ("BulkOperationStatus", ".enums"),
+            ("BulkOperationNodeBulkOperation", ".bulk_operation"),
         ):
-            self._add_import("BulkOperationStatus", ".enums", False)
-            self._add_import("BulkOperationNodeBulkOperation", ".bulk_operation", False)
+            if (module_name, name) not in runtime_imports:
+                self._add_import(name, module_name, False)
 
     def _enhance_class_with_bulk_methods(
-        self, class_def: ast.ClassDef, module: ast.Module
+        self, class_def: ast.ClassDef
     ) -> List[ast.AsyncFunctionDef]:
-        new_methods: List[ast.AsyncFunctionDef] = []
-        existing_method_names: Set[str] = {
-            method.name
-            for method in class_def.body
-            if isinstance(method, ast.AsyncFunctionDef)
-        }
-
+        async_methods: List[ast.AsyncFunctionDef] = []
+        existing_method_names: Set[str] = set()
         for method in class_def.body:
             if isinstance(method, ast.AsyncFunctionDef):
+                async_methods.append(method)
+                existing_method_names.add(method.name)
+        # Models and enums have no async methods, nothing to enhance
+        if not async_methods:
+            return []
 
-                bulk_method_name: str = f"bq_{method.name}"
+        new_methods: List[ast.AsyncFunctionDef] = []
 
-                if bulk_method_name in existing_method_names:
-                    logging.info(
-                        f"Skipping bulk method creation for already existing method: {bulk_method_name}"
-                    )
-                    continue
+        for method in async_methods:
+            bulk_method_name: str = f"bq_{method.name}"
 
-                if method.name.startswith("bq_"):
-                    logging.info(
-                        f"Skipping bulk method creation for already enhanced method: {method.name}"
-                    )
-                    continue
+            if bulk_method_name in existing_method_names:
+                logging.info(
+                    f"Skipping bulk method creation for already existing method: {bulk_method_name}"
+                )
+                continue
 
-                if method.returns is None:
-                    logging.info(
-                        f"Skipping bulk method creation for: {method.name} due to it not returning anything"
-                    )
-                    continue
+            if method.name.startswith("bq_"):
+                logging.info(
+                    f"Skipping bulk method creation for already enhanced method: {method.name}"
+                )
+                continue
 
-                ret: Optional[Tuple[ast.expr, str]] = self._is_list_return_type(
-                    method.returns, module
+            if method.returns is None:
+                logging.info(
+                    f"Skipping bulk method creation for: {method.name} due to it not returning anything"
                 )
+                continue
 
-                if ret:
-                    return_type, module_name = ret
+            ret: Optional[Tuple[ast.expr, str]] = self._is_list_return_type(
+                method.returns
+            )
 
-                    gql_var_name: str = f"{method.name.upper()}_GQL"
-                    bulk_method: Optional[ast.AsyncFunctionDef] = (
-                        self._create_bulk_method(
-                            method, gql_var_name, module_name, return_type
-                        )
-                    )
-                    if bulk_method:
-                        new_methods.append(bulk_method)
-                        existing_method_names.add(bulk_method_name)
-                        logging.info(f"Bulk method created: {bulk_method.name}")
-                else:
-                    logging.info(
-                        f"Skipping bulk method creation for: {method.name} due to it not returning a list"
+            if ret:
+                return_type, module_name = ret
+
+                gql_var_name: str = f"{method.name.upper()}_GQL"
+                bulk_method: Optional[ast.AsyncFunctionDef] = (
+                    self._create_bulk_method(
+                        method, gql_var_name, module_name, return_type
                     )
+                )
+                if bulk_method:
+                    new_methods.append(bulk_method)
+                    existing_method_names.add(bulk_method_name)
+                    logging.info(f"Bulk method created: {bulk_method.name}")
+            else:
+                logging.info(
+                    f"Skipping bulk method creation for: {method.name} due to it not returning a list"
+                )
 
         return new_methods
 
     def _is_list_return_type(
-        self, return_type: ast.expr, module: ast.Module
+        self, return_type: ast.expr
     ) -> Optional[Tuple[ast.expr, str]]:
-        if isinstance(return_type, ast.Constant) or isinstance(return_type, ast.Name):
-            if isinstance(return_type, ast.Constant):
-                class_name = return_type.value
-            else:
-                class_name = return_type.id
-            result = self._get_class_ast(class_name, module)
+        # Anything other than a plain or quoted class name can't be a connection
+        if isinstance(return_type, ast.Constant):
+            class_name = return_type.value
+        elif isinstance(return_type, ast.Name):
+            class_name = return_type.id
+        else:
+            return None
+
+        # Many queries return the same connection type, resolve each one once
+        list_return_types = self._list_return_types
+        cache_key = (class_name, isinstance(return_type, ast.Name))
+        if cache_key in list_return_types:
+            ret = list_return_types[cache_key]
+        else:
+            ret = None
+            result = self._get_class_module(class_name)
             if result:
-                class_ast, class_module_name = result
+                module_info, class_module_name = result
                 if isinstance(return_type, ast.Name):
                     class_module_name = "." + class_module_name
-                class_def = self._find_class_in_ast(class_name, class_ast)
-                if class_def:
-                    for node in ast.walk(class_def):
-                        if (
-                            isinstance(node, ast.AnnAssign)
-                            and isinstance(node.annotation, ast.Subscript)
-                            and isinstance(node.target, ast.Name)
-                            and node.target.id == "edges"
-                            and isinstance(node.annotation.value, ast.Name)
-                            and node.annotation.value.id == "List"
-                        ):
-                            if (
-                                isinstance(node.annotation.slice, ast.Constant)
-                                and node.annotation.slice.value
-                            ):
-                                node_class_def = self._find_class_in_ast(
-                                    node.annotation.slice.value, class_ast
-                                )
-                                if node_class_def:
-                                    for class_node in ast.walk(node_class_def):
-                                        if (
-                                            isinstance(class_node, ast.AnnAssign)
-                                            and isinstance(class_node.target, ast.Name)
-                                            and class_node.target.id == "node"
-                                        ):
-                                            self._add_import_to_module(
-                                                class_node.annotation,
-                                                class_module_name,
-                                            )
-                                            return (
-                                                class_node.annotation,
-                                                class_module_name,
-                                            )
-        return None
-
-    def _get_class_ast(
-        self, class_name: str, module: ast.Module
-    ) -> Optional[Tuple[ast.Module, str]]:
-        for node in ast.walk(module):
-            if isinstance(node, ast.ImportFrom):
-                for alias in node.names:
-                    if (
-                        isinstance(alias, ast.alias)
-                        and alias.name == class_name
-                        and node.module
-                    ):
-                        absolute_module = f"graphpyshop.client.{node.module}"
-                        try:
-                            # Get the file path of the module
-                            module_file_path = absolute_module.replace(".", "/") + ".py"
-                            with open(module_file_path, "r") as file:
-                                class_source = file.read()
-                            return ast.parse(class_source), node.module
-                        except (FileNotFoundError, OSError) as e:
-                            logging.warning(
-                                f"Could not read {class_name} from {absolute_module}: {e}"
-                            )
-                            return None
-        return None
-
-    def _find_class_in_ast(
-        self, class_name: str, class_ast: ast.Module
-    ) -> Optional[ast.ClassDef]:
-        for class_node in ast.walk(class_ast):
-            if isinstance(class_node, ast.ClassDef) and class_node.name == class_name:
-                return class_node
-        return None
+                node_annotation = module_info.edges_node_types.get(class_name)
+                if node_annotation is not None:
+                    ret = node_annotation, class_module_name
+            list_return_types[cache_key] = ret
+
+        if ret is None:
+            return None
+        self._add_import_to_module(*ret)
+        # The cached annotation belongs to the scanned module, every bulk method
+        # gets its own copy as a node must have a single parent
+        node_annotation, class_module_name = ret
+        return copy.deepcopy(node_annotation), class_module_name
+
+    def _get_class_module(self, class_name: str) -> Optional[Tuple[ModuleInfo, str]]:
+        module_name = self._symbol_modules.get(class_name)
+        if module_name is None:
+            return None
+        module_info = self._load_module(_client_module_path(module_name))
+        if module_info is None:
+            logging.warning(
+                f"Could not read {class_name} from graphpyshop.client.{module_name}"
+            )
+            return None
+        return module_info, module_name
 
     def _add_import_to_module(self, class_name: ast.expr, module_name: str):
-        if isinstance(class_name, ast.Subscript):
+        if isinstance(class_name, ast.Constant):
+            # Handle simple constant case (e.g., str), the usual forward reference
+            self._add_import(name=class_name.value, module_name=module_name)
+        elif isinstance(class_name, ast.Subscript):
             # Handle subscript case (e.g., List[str])
             if isinstance(class_name.slice, ast.Constant):
                 self._add_import(name=class_name.slice.value, module_name=module_name)
@@ -243,9 +437,6 @@ class ShopifyBulkQueriesPlugin(Plugin):
                 for elt in class_name.slice.elts:
                     if isinstance(elt, ast.Constant):
                         self._add_import(name=elt.value, module_name=module_name)
-        elif isinstance(class_name, ast.Constant):
-            # Handle simple constant case (e.g., str)
-            self._add_import(name=class_name.value, module_name=module_name)
         else:
             logging.error(
                 f"Unsupported type for class_name: {type(class_name).__name__}"
@@ -254,12 +445,14 @@ class ShopifyBulkQueriesPlugin(Plugin):
     def _add_import(
         self, name: str, module_name: str, under_type_checking: bool = True
     ) -> None:
-        if module_name not in self.pending_imports:
-            self.pending_imports[module_name] = set()
-
         self.pending_imports[module_name].add((name, under_type_checking))
 
-    def _flush_pending_imports(self, module: ast.Module) -> None:
+    def _flush_pending_imports(
+        self,
+        module: ast.Module,
+        runtime_imports: Set[Tuple[str, str]],
+        all_imports: Set[Tuple[str, str]],
+    ) -> List[ast.ImportFrom]:
         # Generate import statements for all collected names grouped by module
         type_checking_node = None
         for node in module.body:
@@ -271,25 +464,39 @@ class ShopifyBulkQueriesPlugin(Plugin):
                 type_checking_node = node
                 break
 
+        grouped: Dict[Tuple[str, bool], Set[str]] = {}
         for module_name, names in self.pending_imports.items():
             for name, under_type_checking in names:
-                import_stmt = ast.ImportFrom(
-                    module=module_name,
-                    names=[ast.alias(name=name, asname=None)],
-                    level=0,
+                under_type_checking = bool(type_checking_node) and under_type_checking
+                existing_imports = all_imports if under_type_checking else runtime_imports
+                if (module_name, name) in existing_imports:
+                    continue
+                grouped.setdefault((module_name, under_type_checking), set()).add(name)
+
+        new_imports: List[ast.ImportFrom] = []
+        top_level_imports: List[ast.stmt] = []
+        for (module_name, under_type_checking), names in grouped.items():
+            sorted_names = sorted(names)
+            import_stmt = ast.ImportFrom(
+                module=module_name,
+                names=[ast.alias(name=name, asname=None) for name in sorted_names],
+                level=0,
+            )
+            new_imports.append(import_stmt)
+            if type_checking_node and under_type_checking:
+                type_checking_node.body.append(import_stmt)
+                logging.info(
+                    f"Import for {', '.join(sorted_names)} from {module_name} added under TYPE_CHECKING."
                 )
-                if type_checking_node and under_type_checking:
-                    type_checking_node.body.append(import_stmt)
-                    logging.info(
-                        f"Import for {name} from {module_name} added under TYPE_CHECKING."
-                    )
-                else:
-                    module.body.insert(0, import_stmt)
-                    logging.info(
-                        f"Import for {name} from {module_name} added outside TYPE_CHECKING."
-                    )
+            else:
+                top_level_imports.append(import_stmt)
+                logging.info(
+                    f"Import for {', '.join(sorted_names)} from {module_name} added outside TYPE_CHECKING."
+                )
+        module.body[0:0] = top_level_imports
 
-        self.pending_imports = {}  # Reset after flushing
+        self.pending_imports.clear()  # Reset after flushing
+        return new_imports
 
     def _create_bulk_method(
         self,
@@ -305,17 +512,15 @@ class ShopifyBulkQueriesPlugin(Plugin):
             body=self._generate_bulk_method_body(method_def, gql_var_name, module_name),
             decorator_list=[],
             returns=ast.Subscript(
-                value=ast.Name(id="AsyncGenerator", ctx=ast.Load()),
-                slice=ast.Index(
-                    value=ast.Tuple(
-                        elts=[
-                            return_type,
-                            ast.Name(id="None", ctx=ast.Load()),
-                        ],
-                        ctx=ast.Load(),
-                    )
+                value=ast.Name(id="AsyncGenerator", ctx=_LOAD),
+                slice=ast.Tuple(
+                    elts=[
+                        return_type,
+                        ast.Name(id="None", ctx=_LOAD),
+                    ],
+                    ctx=_LOAD,
                 ),
-                ctx=ast.Load(),
+                ctx=_LOAD,
             ),
         )
         return bulk_method_def
@@ -325,6 +530,19 @@ class ShopifyBulkQueriesPlugin(Plugin):
             module=module_name, names=[ast.alias(name=class_name, asname=None)], level=0
         )
 
+    def _get_typename_dict(self, module_name: str) -> ast.Dict:
+        # Bulk methods of the same module share the typename map, but every
+        # method gets its own nodes as a node must have a single parent
+        items = self._typename_items_cache.get(module_name)
+        if items is None:
+            items = self._typename_items_cache[module_name] = list(
+                self.get_typename_to_class_map(module_name).items()
+            )
+        return ast.Dict(
+            keys=[ast.Constant(value=typename) for typename, _ in items],
+            values=[ast.Constant(value=class_name) for _, class_name in items],
+        )
+
     def _generate_bulk_method_body(
         self, method_def: ast.AsyncFunctionDef, gql_var_name: str, module_name: str
     ):
@@ -341,77 +559,64 @@ class ShopifyBulkQueriesPlugin(Plugin):
         """
 
         # Generate the variables assignment dynamically based on the method definition, excluding 'self'
+        ignore_args = self._ignore_args_full
+        arg_names = [
+            arg.arg for arg in method_def.args.args if arg.arg not in ignore_args
+        ]
         variables_assignment = ast.AnnAssign(
-            target=ast.Name(id="variables", ctx=ast.Store()),
+            target=ast.Name(id="variables", ctx=_STORE),
             annotation=ast.Subscript(
-                value=ast.Name(id="Dict", ctx=ast.Load()),
+                value=ast.Name(id="Dict", ctx=_LOAD),
                 slice=ast.Tuple(
                     elts=[
-                        ast.Name(id="str", ctx=ast.Load()),
-                        ast.Name(id="Any", ctx=ast.Load()),
+                        ast.Name(id="str", ctx=_LOAD),
+                        ast.Name(id="Any", ctx=_LOAD),
                     ],
-                    ctx=ast.Load(),
+                    ctx=_LOAD,
                 ),
-                ctx=ast.Load(),
+                ctx=_LOAD,
             ),
             value=ast.Dict(
-                keys=[
-                    ast.Constant(value=arg.arg)
-                    for arg in method_def.args.args
-                    if arg.arg not in self._ignore_args_full
-                ],
-                values=[
-                    ast.Name(id=arg.arg, ctx=ast.Load())
-                    for arg in method_def.args.args
-                    if arg.arg not in self._ignore_args_full
-                ],
+                keys=[ast.Constant(value=arg_name) for arg_name in arg_names],
+                values=[ast.Name(id=arg_name, ctx=_LOAD) for arg_name in arg_names],
             ),
             simple=1,
         )
 
+        typename_dict = self._get_typename_dict(module_name)
+
         # Construct the call for the async for loop
         call_expression = ast.Call(
             func=ast.Attribute(
-                value=ast.Name(id="self", ctx=ast.Load()),
+                value=ast.Name(id="self", ctx=_LOAD),
                 attr="run_bulk_operation",
-                ctx=ast.Load(),
+                ctx=_LOAD,
             ),
             args=[
                 ast.Attribute(
-                    value=ast.Name(id="self", ctx=ast.Load()),
+                    value=ast.Name(id="self", ctx=_LOAD),
                     attr="bulk_operation_run_query",
-                    ctx=ast.Load(),
+                    ctx=_LOAD,
                 ),
                 ast.Attribute(
-                    value=ast.Name(id="self", ctx=ast.Load()),
+                    value=ast.Name(id="self", ctx=_LOAD),
                     attr="bulk_operation",
-                    ctx=ast.Load(),
-                ),
-                ast.Name(id=gql_var_name, ctx=ast.Load()),
-                ast.Name(id="variables", ctx=ast.Load()),
-                ast.Name(id="BulkOperationStatus", ctx=ast.Load()),
-                ast.Name(id="BulkOperationNodeBulkOperation", ctx=ast.Load()),
-                ast.Dict(
-                    keys=[
-                        ast.Constant(value=key)
-                        for key in self.get_typename_to_class_map(module_name).keys()
-                    ],
-                    values=[
-                        ast.Constant(value=value)
-                        for value in self.get_typename_to_class_map(
-                            module_name
-                        ).values()
-                    ],
+                    ctx=_LOAD,
                 ),
+                ast.Name(id=gql_var_name, ctx=_LOAD),
+                ast.Name(id="variables", ctx=_LOAD),
+                ast.Name(id="BulkOperationStatus", ctx=_LOAD),
+                ast.Name(id="BulkOperationNodeBulkOperation", ctx=_LOAD),
+                typename_dict,
             ],
             keywords=[],
         )
 
         # Async for loop body with yield
         async_for_loop = ast.AsyncFor(
-            target=ast.Name(id="item", ctx=ast.Store()),
+            target=ast.Name(id="item", ctx=_STORE),
             iter=call_expression,
-            body=[ast.Expr(value=ast.Yield(value=ast.Name(id="item", ctx=ast.Load())))],
+            body=[ast.Expr(value=ast.Yield(value=ast.Name(id="item", ctx=_LOAD)))],
             orelse=[],
         )
 
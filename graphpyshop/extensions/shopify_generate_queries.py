@@ -1,8 +1,10 @@
 import logging
 import os
 import time
+from collections import defaultdict
+from dataclasses import dataclass
 from functools import lru_cache
-from typing import Any, Dict, List, Optional, Set, Union
+from typing import Any, DefaultDict, Dict, FrozenSet, List, Optional, Set, Union
 
 from ariadne_codegen.config import get_client_settings, get_config_dict
 from ariadne_codegen.schema import (
@@ -26,6 +28,7 @@ from graphql.language.ast import (
     FieldDefinitionNode,
     FieldNode,
     InlineFragmentNode,
+    InputValueDefinitionNode,
     InterfaceTypeDefinitionNode,
     IntValueNode,
     ListTypeNode,
@@ -44,6 +47,16 @@ from graphql.language.ast import (
 )
 
 
+@dataclass(slots=True)
+class QueryContext:
+    """State shared by every level of one query's traversal."""
+
+    query_name: str
+    max_depth: int
+    query_return_type: Optional[str]
+    variables: Dict[str, VariableDefinitionNode]
+
+
 class ShopifyQueryGenerator:
     def __init__(self, settings: Optional[ClientSettings] = None) -> None:
         self.max_depth_overrides: Dict[str, int] = {"checkoutBranding": 4}
@@ -69,15 +82,15 @@ class ShopifyQueryGenerator:
                 "StaffMember": [],
             },
         }
-        self.field_name_rules: Dict[str, List[str]] = {
-            "include": [],
-            "exclude": [
+        self.field_name_rules: Dict[str, Set[str]] = {
+            "include": set(),
+            "exclude": {
                 "legacyResourceId",
                 "nodes",
                 "metafield",
                 "metafieldsByIdentifiers",
                 "originalSource",  # TODO: Implement recursive field collision detection, then it can be removed
-            ],
+            },
         }
 
         self._created_dirs: set[str] = set()
@@ -124,36 +137,25 @@ class ShopifyQueryGenerator:
                     f"Schema written to {self.settings.target_package_path}/schema.graphql"
                 )
         self.ast = parse(self.sdl)
-        self.type_definition_map: Dict[str, TypeDefinitionNode] = (
-            self.create_type_definition_map()
-        )
+        # Name-keyed memos depend on the schema, drop them before rebuilding
+        self.find_ultimate_object.cache_clear()
+        self.is_core_type.cache_clear()
+        self.index_definitions()
         self.list_returning_queries: Dict[str, str] = (
             self.extract_list_returning_queries()
         )
         self.list_returning_queries_by_type: Dict[str, List[str]] = (
             self.reverse_list_returning_queries()
         )
-        self.direct_object_references: Dict[str, List[str]] = (
+        self.direct_object_references: Dict[str, FrozenSet[str]] = (
             self.extract_direct_object_references()
         )
-        self.scalar_types: Set[str] = {
-            definition.name.value
-            for definition in self.ast.definitions
-            if isinstance(definition, ScalarTypeDefinitionNode)
-        }
-        self.enum_types: Set[str] = {
-            definition.name.value
-            for definition in self.ast.definitions
-            if isinstance(definition, EnumTypeDefinitionNode)
-        }
 
         self.used_variables: Dict[str, Dict[str, VariableDefinitionNode]] = {}
 
-    @lru_cache(maxsize=None)
     def is_deprecated(self, field: FieldDefinitionNode) -> bool:
-        return any(
-            directive.name.value == "deprecated" for directive in field.directives
-        )
+        # Only fields of the loaded schema are indexed, see index_definitions
+        return id(field) in self.deprecated_field_ids
 
     @lru_cache(maxsize=None)
     def get_field_type(self, field_type: TypeNode) -> TypeNode:
@@ -210,45 +212,36 @@ class ShopifyQueryGenerator:
 
     def extract_list_returning_queries(self) -> Dict[str, str]:
         list_returning_queries: Dict[str, str] = {}
-        for definition in self.ast.definitions:
-            if (
-                isinstance(definition, ObjectTypeDefinitionNode)
-                and definition.name.value == "QueryRoot"
-            ):
-                for field in definition.fields:
-                    if not self.is_deprecated(field):
-                        field_type_name = self.get_field_type_name(field.type)
-                        ultimate_object = self.find_ultimate_object(field_type_name)
-                        if self.returns_a_list(field):
-                            list_returning_queries[field.name.value] = ultimate_object
+        definition = self.type_definition_map.get("QueryRoot")
+        if isinstance(definition, ObjectTypeDefinitionNode):
+            for field in definition.fields:
+                if not self.is_deprecated(field):
+                    field_type_name = self.get_field_type_name(field.type)
+                    ultimate_object = self.find_ultimate_object(field_type_name)
+                    if self.returns_a_list(field):
+                        list_returning_queries[field.name.value] = ultimate_object
         return list_returning_queries
 
     def reverse_list_returning_queries(self) -> Dict[str, List[str]]:
-        list_returning_queries_by_type: Dict[str, List[str]] = {}
+        list_returning_queries_by_type: DefaultDict[str, List[str]] = defaultdict(list)
         for key, value in self.list_returning_queries.items():
-            if value in list_returning_queries_by_type:
-                list_returning_queries_by_type[value].append(key)
-            else:
-                list_returning_queries_by_type[value] = [key]
-        return list_returning_queries_by_type
+            list_returning_queries_by_type[value].append(key)
+        # Plain dict so lookups of unknown types don't insert empty entries
+        return dict(list_returning_queries_by_type)
 
-    def extract_direct_object_references(self) -> Dict[str, List[str]]:
-        direct_object_references: Dict[str, List[str]] = {}
+    def extract_direct_object_references(self) -> Dict[str, FrozenSet[str]]:
+        direct_object_references: Dict[str, FrozenSet[str]] = {}
         for key in self.list_returning_queries_by_type:
             direct_references: Set[str] = set()
-            for definition in self.ast.definitions:
-                if (
-                    isinstance(definition, ObjectTypeDefinitionNode)
-                    and definition.name.value == key
-                ):
-                    for field in definition.fields:
-                        field_type = self.get_field_type(field.type)
-                        if (
-                            isinstance(field_type, NamedTypeNode)
-                            and field_type.name.value
-                            in self.list_returning_queries_by_type
-                        ):
-                            direct_references.add(field_type.name.value)
+            definition = self.type_definition_map.get(key)
+            if isinstance(definition, ObjectTypeDefinitionNode):
+                for field in definition.fields:
+                    field_type = self.get_field_type(field.type)
+                    if (
+                        isinstance(field_type, NamedTypeNode)
+                        and field_type.name.value in self.list_returning_queries_by_type
+                    ):
+                        direct_references.add(field_type.name.value)
             if key == "MetafieldDefinition":
                 for enum_definition in self.ast.definitions:
                     if (
@@ -262,65 +255,83 @@ class ShopifyQueryGenerator:
                             )
                             direct_references.add(formatted_value)
             if direct_references:
-                direct_object_references[key] = list(direct_references)
+                direct_object_references[key] = frozenset(direct_references)
         return direct_object_references
 
     def handle_arguments(
-        self,
-        field: FieldDefinitionNode,
-        variables: Dict[str, VariableDefinitionNode],
-        field_type_name: str,
-        query_name: str,
+        self, ctx: QueryContext, field: FieldDefinitionNode, field_type_name: str
     ) -> List[ArgumentNode]:
-        arguments: List[ArgumentNode] = []
-        for arg in field.arguments:
-            type_name = self.get_field_type_name(arg.type)
-            variable_name = f"{field.name.value}_{arg.name.value}"
-            if type_name not in self.core_types:
-                variable_name += f"_{type_name}"
-            if variable_name not in variables:
-                default_value = self.hardcoded_defaults.get(
-                    arg.name.value, arg.default_value
-                )
-                variables[variable_name] = VariableDefinitionNode(
-                    variable=VariableNode(name=NameNode(value=variable_name)),
-                    type=arg.type,
-                    default_value=default_value,
-                )
-            arguments.append(
-                ArgumentNode(
-                    name=NameNode(value=arg.name.value),
-                    value=VariableNode(name=NameNode(value=variable_name)),
-                )
+        field_name = field.name.value
+        return [self.create_argument(ctx, field_name, arg) for arg in field.arguments]
+
+    def create_argument(
+        self, ctx: QueryContext, owner_name: str, arg: InputValueDefinitionNode
+    ) -> ArgumentNode:
+        arg_name = arg.name.value
+        type_name = self.get_field_type_name(arg.type)
+        variable_name = f"{owner_name}_{arg_name}"
+        if type_name not in self.core_types:
+            variable_name += f"_{type_name}"
+        variable_definition = ctx.variables.get(variable_name)
+        if variable_definition is None:
+            variable_definition = VariableDefinitionNode(
+                variable=VariableNode(name=NameNode(value=variable_name)),
+                type=arg.type,
+                default_value=self.hardcoded_defaults.get(arg_name, arg.default_value),
             )
-            self.used_variables[query_name][variable_name] = variables[variable_name]
-        return arguments
+            ctx.variables[variable_name] = variable_definition
+        # Reuse the definition's variable node, it prints the same
+        return ArgumentNode(
+            name=NameNode(value=arg_name), value=variable_definition.variable
+        )
 
-    def create_type_definition_map(self) -> Dict[str, TypeDefinitionNode]:
-        type_definition_map: Dict[str, TypeDefinitionNode] = {}
+    def index_definitions(self) -> None:
+        """Build every per-type lookup the traversal needs in one pass over the AST."""
+        self.type_definition_map: Dict[str, TypeDefinitionNode] = {}
+        self.implementers_by_interface: Dict[str, List[ObjectTypeDefinitionNode]] = {}
+        self.scalar_types: Set[str] = set()
+        self.enum_types: Set[str] = set()
+        deprecated_field_ids: Set[int] = set()
         for definition in self.ast.definitions:
             if isinstance(
-                definition,
-                (
-                    ObjectTypeDefinitionNode,
-                    InterfaceTypeDefinitionNode,
-                    UnionTypeDefinitionNode,
-                ),
+                definition, (ObjectTypeDefinitionNode, InterfaceTypeDefinitionNode)
             ):
-                type_definition_map[definition.name.value] = definition
-        return type_definition_map
+                self.type_definition_map[definition.name.value] = definition
+                for field in definition.fields:
+                    if any(
+                        directive.name.value == "deprecated"
+                        for directive in field.directives
+                    ):
+                        deprecated_field_ids.add(id(field))
+                if isinstance(definition, ObjectTypeDefinitionNode):
+                    for interface in definition.interfaces:
+                        self.implementers_by_interface.setdefault(
+                            interface.name.value, []
+                        ).append(definition)
+            elif isinstance(definition, UnionTypeDefinitionNode):
+                self.type_definition_map[definition.name.value] = definition
+            elif isinstance(definition, ScalarTypeDefinitionNode):
+                self.scalar_types.add(definition.name.value)
+            elif isinstance(definition, EnumTypeDefinitionNode):
+                self.enum_types.add(definition.name.value)
+        self.deprecated_field_ids: FrozenSet[int] = frozenset(deprecated_field_ids)
+
+    def create_inline_fragment(
+        self, type_name: str, selections: List[FieldNode | InlineFragmentNode]
+    ) -> InlineFragmentNode:
+        return InlineFragmentNode(
+            type_condition=NamedTypeNode(name=NameNode(value=type_name)),
+            selection_set=SelectionSetNode(selections=selections),
+        )
 
     def generate_subfield_selections(
         self,
+        ctx: QueryContext,
         field_type_name: str,
-        query_return_type: str | None,
-        query_name: str,
         definition: TypeDefinitionNode,
         depth: int,
-        max_depth: int,
         field: FieldDefinitionNode,
         current_path: str,
-        variables: Dict[str, VariableDefinitionNode],
         inline_fragment_type_name: str | None = None,
     ) -> List[FieldNode | InlineFragmentNode]:
         selections: List[FieldNode | InlineFragmentNode] = []
@@ -343,30 +354,25 @@ class ShopifyQueryGenerator:
                         sub_fields.extend(sub_definition.fields)
 
         for sub_field in sub_fields:
+            sub_field_name = sub_field.name.value
             new_depth = (
-                depth
-                if sub_field.name.value in {"edges", "node", "pageInfo"}
-                else depth + 1
+                depth if sub_field_name in {"edges", "node", "pageInfo"} else depth + 1
             )
             sub_query = self.generate_query_ast(
-                query_name,
+                ctx,
                 sub_field,
                 new_depth,
-                max_depth,
                 field,
                 current_path,
-                variables,
                 inline_fragment_type_name,
             )
             if isinstance(sub_query, FieldNode) or (
                 isinstance(sub_query, SelectionSetNode) and sub_query.selections
             ):
-                sub_arguments = self.handle_arguments(
-                    sub_field, variables, field_type_name, query_name
-                )
+                sub_arguments = self.handle_arguments(ctx, sub_field, field_type_name)
                 if isinstance(sub_query, SelectionSetNode):
                     sub_query = FieldNode(
-                        name=NameNode(value=sub_field.name.value),
+                        name=NameNode(value=sub_field_name),
                         selection_set=sub_query,
                         arguments=sub_arguments,
                     )
@@ -380,39 +386,37 @@ class ShopifyQueryGenerator:
 
     def should_skip_field(
         self,
+        ctx: QueryContext,
         field: FieldDefinitionNode,
         ultimate_field_type_name: str,
         depth: int,
-        max_depth: int,
-        query_name: str,
         current_path: str,
         parent_type_name: Optional[str],
-        query_return_type: Optional[str],
         field_type_name: str,
         parent_definition: Optional[TypeDefinitionNode] = None,
         inline_fragment_type_name: str | None = None,
     ) -> bool:
         if field.name.value in self.field_name_rules["exclude"]:
             logging.debug(
-                f"[{query_name}][{current_path}][depth: {depth}] Skipping field {field.name.value} as it is in the exclude list"
+                f"[{ctx.query_name}][{current_path}][depth: {depth}] Skipping field {field.name.value} as it is in the exclude list"
             )
             return True
 
         if ultimate_field_type_name in self.field_type_rules["exclude"]:
             logging.debug(
-                f"[{query_name}][{current_path}][depth: {depth}] Skipping as it's an excluded field"
+                f"[{ctx.query_name}][{current_path}][depth: {depth}] Skipping as it's an excluded field"
             )
             return True
 
-        if depth > max_depth:
+        if depth > ctx.max_depth:
             logging.debug(
-                f"[{query_name}][{current_path}][depth: {depth}] Max depth reached. Returning empty selection set."
+                f"[{ctx.query_name}][{current_path}][depth: {depth}] Max depth reached. Returning empty selection set."
             )
             return True
 
         if self.is_deprecated(field):
             logging.debug(
-                f"[{query_name}][{current_path}][depth: {depth}] Field {field.name.value} is deprecated. Skipping."
+                f"[{ctx.query_name}][{current_path}][depth: {depth}] Field {field.name.value} is deprecated. Skipping."
             )
             return True
 
@@ -420,35 +424,35 @@ class ShopifyQueryGenerator:
             isinstance(arg.type, NonNullTypeNode) for arg in field.arguments
         ):
             logging.debug(
-                f"[{query_name}][{current_path}][depth: {depth}] Skipping field {field.name.value} as it has required non-null arguments"
+                f"[{ctx.query_name}][{current_path}][depth: {depth}] Skipping field {field.name.value} as it has required non-null arguments"
             )
             return True
 
         if field.name.value == "order":
             logging.debug(
-                f"[{query_name}][{current_path}][depth: {depth}] Skipping field as it's an Order type"
+                f"[{ctx.query_name}][{current_path}][depth: {depth}] Skipping field as it's an Order type"
             )
 
         if (
             ultimate_field_type_name in self.list_returning_queries_by_type
             and ultimate_field_type_name in self.direct_object_references
-            and query_return_type
+            and ctx.query_return_type
             in self.direct_object_references[ultimate_field_type_name]
         ):
             logging.debug(
-                f"[{query_name}][{current_path}][depth: {depth}] Skipping field as another object refers to this directly"
+                f"[{ctx.query_name}][{current_path}][depth: {depth}] Skipping field as another object refers to this directly"
             )
             return True
 
         if depth > 1 and (
             parent_type_name
-            and parent_type_name != query_return_type
+            and parent_type_name != ctx.query_return_type
             and parent_type_name in self.field_type_rules["include"]
             and field_type_name
             not in self.field_type_rules["include"][parent_type_name]
         ):
             logging.debug(
-                f"[{query_name}][{current_path}][depth: {depth}] Field type {parent_type_name} includes subfield type {field_type_name}, returning empty set"
+                f"[{ctx.query_name}][{current_path}][depth: {depth}] Field type {parent_type_name} includes subfield type {field_type_name}, returning empty set"
             )
             return True
 
@@ -463,7 +467,7 @@ class ShopifyQueryGenerator:
             and field_type_name != "ID"
         ):
             logging.debug(
-                f"[{query_name}][{current_path}][depth: {depth}] It's a list returning field and type is not ID, returning empty set"
+                f"[{ctx.query_name}][{current_path}][depth: {depth}] It's a list returning field and type is not ID, returning empty set"
             )
             return True
 
@@ -478,7 +482,7 @@ class ShopifyQueryGenerator:
             )
         ):
             logging.debug(
-                f"[{query_name}][{current_path}][depth: {depth}] Field {field.name.value} already included in parent type {parent_type_name}. Skipping."
+                f"[{ctx.query_name}][{current_path}][depth: {depth}] Field {field.name.value} already included in parent type {parent_type_name}. Skipping."
             )
             return True
 
@@ -528,20 +532,17 @@ class ShopifyQueryGenerator:
 
     def generate_query_ast(
         self,
-        query_name: str,
+        ctx: QueryContext,
         field: FieldDefinitionNode,
         depth: int,
-        max_depth: int,
         parent: Optional[FieldDefinitionNode] = None,
         path: str = "",
-        variables: Dict[str, VariableDefinitionNode] = {},
         inline_fragment_type_name: str | None = None,
     ) -> SelectionSetNode | FieldNode:
         current_path = f"{path} > {field.name.value}" if path else field.name.value
         parent_type_name = self.get_field_type_name(parent.type) if parent else None
         field_type_name = self.get_field_type_name(field.type)
         ultimate_field_type_name = self.find_ultimate_object(field_type_name)
-        query_return_type = self.list_returning_queries.get(query_name, None)
         parent_definition = (
             self.type_definition_map.get(parent_type_name)
             if parent_type_name in self.type_definition_map
@@ -549,14 +550,12 @@ class ShopifyQueryGenerator:
         )
 
         if self.should_skip_field(
+            ctx,
             field,
             ultimate_field_type_name,
             depth,
-            max_depth,
-            query_name,
             current_path,
             parent_type_name,
-            query_return_type,
             field_type_name,
             parent_definition,
             inline_fragment_type_name,
@@ -566,11 +565,9 @@ class ShopifyQueryGenerator:
         selections: List[Union[FieldNode, InlineFragmentNode]] = []
         if self.is_core_type(field_type_name):
             logging.debug(
-                f"[{query_name}][{current_path}][depth: {depth}] Adding core type field {field.name.value}"
-            )
-            sub_arguments = self.handle_arguments(
-                field, variables, field_type_name, query_name
+                f"[{ctx.query_name}][{current_path}][depth: {depth}] Adding core type field {field.name.value}"
             )
+            sub_arguments = self.handle_arguments(ctx, field, field_type_name)
             selections.append(
                 FieldNode(
                     name=NameNode(value=field.name.value),
@@ -581,7 +578,7 @@ class ShopifyQueryGenerator:
             if field_type_name in self.type_definition_map:
                 definition = self.type_definition_map[field_type_name]
                 logging.debug(
-                    f"[{query_name}][{current_path}][depth: {depth}] Processing {type(definition).__name__}: {definition.name.value}"
+                    f"[{ctx.query_name}][{current_path}][depth: {depth}] Processing {type(definition).__name__}: {definition.name.value}"
                 )
 
                 subfield_selections = []
@@ -589,77 +586,44 @@ class ShopifyQueryGenerator:
 
                 if not isinstance(definition, UnionTypeDefinitionNode):
                     subfield_selections = self.generate_subfield_selections(
-                        field_type_name,
-                        query_return_type,
-                        query_name,
-                        definition,
-                        depth,
-                        max_depth,
-                        field,
-                        current_path,
-                        variables,
+                        ctx, field_type_name, definition, depth, field, current_path
                     )
 
                 if (
                     isinstance(definition, ObjectTypeDefinitionNode)
                     and subfield_selections
                 ):
-                    sub_arguments = self.handle_arguments(
-                        field, variables, field_type_name, query_name
-                    )
+                    sub_arguments = self.handle_arguments(ctx, field, field_type_name)
 
                 if isinstance(definition, (InterfaceTypeDefinitionNode)):
                     interface_selections = []
-                    for object_definition in self.ast.definitions:
-                        if isinstance(object_definition, ObjectTypeDefinitionNode) and (
-                            field_type_name
-                            in [
-                                interface.name.value
-                                for interface in object_definition.interfaces
-                            ]
-                            or field_type_name
-                            in [
-                                union_type.name.value
-                                for union_type in getattr(
-                                    object_definition, "types", []
-                                )
-                            ]
-                        ):
-                            logging.debug(
-                                f"[{query_name}][{current_path}][depth: {depth}] Found implementing type: {object_definition.name.value}"
-                            )
-                            interface_selections_inside = (
-                                self.generate_subfield_selections(
-                                    field_type_name,
-                                    query_return_type,
-                                    query_name,
-                                    object_definition,
-                                    depth,
-                                    max_depth,
-                                    field,
-                                    current_path,
-                                    variables,
-                                    field_type_name,
+                    for object_definition in self.implementers_by_interface.get(
+                        field_type_name, []
+                    ):
+                        logging.debug(
+                            f"[{ctx.query_name}][{current_path}][depth: {depth}] Found implementing type: {object_definition.name.value}"
+                        )
+                        interface_selections_inside = self.generate_subfield_selections(
+                            ctx,
+                            field_type_name,
+                            object_definition,
+                            depth,
+                            field,
+                            current_path,
+                            field_type_name,
+                        )
+                        interface_selections.append(interface_selections_inside)
+                        if interface_selections_inside:
+                            subfield_selections.append(
+                                self.create_inline_fragment(
+                                    object_definition.name.value,
+                                    interface_selections_inside,
                                 )
                             )
-                            interface_selections.append(interface_selections_inside)
-                            if interface_selections_inside:
-                                subfield_selections.append(
-                                    InlineFragmentNode(
-                                        type_condition=NamedTypeNode(
-                                            name=NameNode(
-                                                value=object_definition.name.value
-                                            )
-                                        ),
-                                        selection_set=SelectionSetNode(
-                                            selections=interface_selections_inside
-                                        ),
-                                    )
-                                )
 
                     if interface_selections:
                         interface_sub_arguments = self.handle_arguments(
-                            field, variables, definition.name.value, query_name
+                            ctx, field, definition.name.value
                         )
                         sub_arguments.extend(interface_sub_arguments)
 
@@ -670,15 +634,12 @@ class ShopifyQueryGenerator:
                         if type_name in self.type_definition_map:
                             object_type = self.type_definition_map[type_name]
                             union_sub_selections = self.generate_subfield_selections(
+                                ctx,
                                 type_name,
-                                query_return_type,
-                                query_name,
                                 object_type,
                                 depth,
-                                max_depth,
                                 field,
                                 current_path,
-                                variables,
                                 type_name,
                             )
                             if len(union_sub_selections) > 0:
@@ -691,18 +652,13 @@ class ShopifyQueryGenerator:
                                             value=f"{type_name[0].lower()}{type_name[1:]}{field_name.capitalize()}"
                                         )
                                 subfield_selections.append(
-                                    InlineFragmentNode(
-                                        type_condition=NamedTypeNode(
-                                            name=NameNode(value=type_name)
-                                        ),
-                                        selection_set=SelectionSetNode(
-                                            selections=union_sub_selections
-                                        ),
+                                    self.create_inline_fragment(
+                                        type_name, union_sub_selections
                                     )
                                 )
                     if len(subfield_selections) > 0:
                         union_sub_arguments = self.handle_arguments(
-                            field, variables, definition.name.value, query_name
+                            ctx, field, definition.name.value
                         )
                         sub_arguments.extend(union_sub_arguments)
                         subfield_selections.append(
@@ -722,7 +678,7 @@ class ShopifyQueryGenerator:
 
         if len(selections) == 0:
             logging.debug(
-                f"[{query_name}][{current_path}][depth: {depth}] Field {field.name.value} has no children. Skipping nested selection."
+                f"[{ctx.query_name}][{current_path}][depth: {depth}] Field {field.name.value} has no children. Skipping nested selection."
             )
             return SelectionSetNode(selections=[])
 
@@ -740,7 +696,7 @@ class ShopifyQueryGenerator:
             ]
 
         logging.debug(
-            f"[{query_name}][{current_path}][depth: {depth}] Returning selection set with {len(selections)} selections."
+            f"[{ctx.query_name}][{current_path}][depth: {depth}] Returning selection set with {len(selections)} selections."
         )
 
         if len(selections) == 1 and isinstance(selections[0], FieldNode):
@@ -751,12 +707,16 @@ class ShopifyQueryGenerator:
     def generate_query_with_variables_ast(
         self, query_name: str, field: FieldDefinitionNode, depth: int, max_depth: int
     ) -> DocumentNode:
+        # The context records variables straight into used_variables
         self.used_variables[query_name] = {}
 
-        variables: Dict[str, VariableDefinitionNode] = {}
-        query_fields = self.generate_query_ast(
-            query_name, field, depth, max_depth, variables=variables
+        ctx = QueryContext(
+            query_name=query_name,
+            max_depth=max_depth,
+            query_return_type=self.list_returning_queries.get(query_name),
+            variables=self.used_variables[query_name],
         )
+        query_fields = self.generate_query_ast(ctx, field, depth)
 
         return DocumentNode(
             definitions=[
@@ -776,8 +736,8 @@ class ShopifyQueryGenerator:
     def process_field(
         self,
         field: FieldDefinitionNode,
-        included_queries: List[str],
-        excluded_queries: List[str],
+        included_queries: FrozenSet[str],
+        excluded_queries: FrozenSet[str],
         write_invalid: bool,
     ) -> Optional[str]:
         start_time = time.time()
@@ -876,16 +836,20 @@ class ShopifyQueryGenerator:
 
         queries: List[str] = []
         query_count = 0
+        # Membership is tested once per root field
+        included = frozenset(included_queries)
+        excluded = frozenset(excluded_queries)
+        root_definitions = frozenset(include_definitions)
 
         for definition in self.ast.definitions:
             if isinstance(definition, ObjectTypeDefinitionNode):
                 type_name = definition.name.value
-                if type_name not in include_definitions:
+                if type_name not in root_definitions:
                     continue
                 for field in definition.fields:
                     if not self.is_deprecated(field):
                         query_str = self.process_field(
-                            field, included_queries, excluded_queries, write_invalid
+                            field, included, excluded, write_invalid
                         )
                         if query_str:
                             if return_queries:
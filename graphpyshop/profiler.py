@@ -1,6 +1,5 @@
 import os
 import time
-from datetime import datetime
 
 profiles_dir = os.path.join(os.path.dirname(__file__), "..", "profiles")
 profiles_dir = os.path.abspath(profiles_dir)
@@ -32,6 +31,8 @@ class CallGrindProfiler:
         self.save_callgrind()
 
     def save_callgrind(self):
+        from datetime import datetime
+
         from pyprof2calltree import convert, visualize
 
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")  # noqa
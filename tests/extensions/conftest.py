@@ -0,0 +1,85 @@
+import ast
+import sys
+import types
+
+import pytest
+from graphql import GraphQLSchema, OperationDefinitionNode, parse
+
+from graphpyshop.extensions.shopify_bulk_queries_plugin import ShopifyBulkQueriesPlugin
+
+# Shaped like ariadne-codegen's output for a bulk query: forward references
+# between the result classes, resolved by the model_rebuild calls at the end
+GENERATED_RESULT_TYPES = """
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+
+class Products(BaseModel):
+    products: "ProductsProducts"
+
+
+class ProductsProducts(BaseModel):
+    edges: List["ProductsProductsEdges"]
+
+
+class ProductsProductsEdges(BaseModel):
+    node: "ProductsProductsEdgesNode"
+
+
+class ProductsProductsEdgesNode(BaseModel):
+    typename__: Literal["Product"] = Field(alias="__typename")
+    id: str
+    title: str
+    variants: "ProductsProductsEdgesNodeVariants"
+
+
+class ProductsProductsEdgesNodeVariants(BaseModel):
+    edges: List["ProductsProductsEdgesNodeVariantsEdges"]
+
+
+class ProductsProductsEdgesNodeVariantsEdges(BaseModel):
+    node: "ProductsProductsEdgesNodeVariantsEdgesNode"
+
+
+class ProductsProductsEdgesNodeVariantsEdgesNode(BaseModel):
+    typename__: Literal["ProductVariant"] = Field(alias="__typename")
+    id: str
+    sku: Optional[str]
+
+
+Products.model_rebuild()
+ProductsProducts.model_rebuild()
+ProductsProductsEdges.model_rebuild()
+ProductsProductsEdgesNode.model_rebuild()
+ProductsProductsEdgesNodeVariants.model_rebuild()
+ProductsProductsEdgesNodeVariantsEdges.model_rebuild()
+"""
+
+
+@pytest.fixture
+def plugin() -> ShopifyBulkQueriesPlugin:
+    return ShopifyBulkQueriesPlugin(schema=GraphQLSchema(), config_dict={})
+
+
+@pytest.fixture
+def client_module(
+    plugin: ShopifyBulkQueriesPlugin, monkeypatch: pytest.MonkeyPatch
+) -> types.ModuleType:
+    """The result types module after the plugin ran, imported as graphpyshop.client"""
+    operation = parse("query products { products { edges { node { id } } } }")
+    assert isinstance(operation.definitions[0], OperationDefinitionNode)
+    module_ast = plugin.generate_result_types_module(
+        ast.parse(GENERATED_RESULT_TYPES), operation.definitions[0]
+    )
+    return load_client_module(ast.unparse(module_ast), monkeypatch)
+
+
+def load_client_module(
+    source: str, monkeypatch: pytest.MonkeyPatch
+) -> types.ModuleType:
+    module = types.ModuleType("graphpyshop.client")
+    # Forward references are resolved against the module in sys.modules
+    monkeypatch.setitem(sys.modules, module.__name__, module)
+    exec(compile(source, "<generated>", "exec"), module.__dict__)
+    return module
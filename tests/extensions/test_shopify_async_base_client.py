@@ -0,0 +1,483 @@
+import asyncio
+import base64
+import enum
+import hashlib
+import hmac
+import sys
+import types
+from datetime import datetime, timezone
+from typing import Any
+
+import httpx
+import orjson
+import pytest
+from pydantic import ValidationError
+
+from graphpyshop.extensions import shopify_async_base_client
+from graphpyshop.extensions.shopify_async_base_client import (
+    AsyncLimiterTransport,
+    ShopifyAsyncBaseClient,
+    aiter_jsonl_lines,
+    get_connection_fields,
+    install_uvloop,
+    verify_webhook,
+)
+
+from .conftest import GENERATED_RESULT_TYPES, load_client_module
+
+TYPENAME_TO_CLASS_MAP = {
+    "Product": "ProductsProductsEdgesNode",
+    "ProductVariant": "ProductsProductsEdgesNodeVariantsEdgesNode",
+}
+
+# Bulk operation output: every parent followed by its children
+BULK_JSONL = [
+    {"__typename": "Product", "id": "gid://shopify/Product/1", "title": "Tee"},
+    {
+        "__typename": "ProductVariant",
+        "id": "gid://shopify/ProductVariant/11",
+        "sku": "TEE-S",
+        "__parentId": "gid://shopify/Product/1",
+    },
+    {
+        "__typename": "ProductVariant",
+        "id": "gid://shopify/ProductVariant/12",
+        "sku": "TEE-M",
+        "__parentId": "gid://shopify/Product/1",
+    },
+    {"__typename": "Product", "id": "gid://shopify/Product/2", "title": "Cap"},
+    {"__typename": "Product", "id": "gid://shopify/Product/3", "title": "Mug"},
+    {
+        "__typename": "ProductVariant",
+        "id": "gid://shopify/ProductVariant/31",
+        "sku": None,
+        "__parentId": "gid://shopify/Product/3",
+    },
+]
+
+
+def without_model_rebuild(source: str) -> str:
+    return "\n".join(
+        line for line in source.splitlines() if ".model_rebuild()" not in line
+    )
+
+
+@pytest.fixture(params=["with_model_rebuild", "without_model_rebuild"])
+def bulk_client_module(
+    request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch
+) -> types.ModuleType:
+    source = GENERATED_RESULT_TYPES
+    if request.param == "without_model_rebuild":
+        source = without_model_rebuild(source)
+    return load_client_module(source, monkeypatch)
+
+
+@pytest.fixture
+def client() -> ShopifyAsyncBaseClient:
+    return ShopifyAsyncBaseClient(
+        url="https://shop.myshopify.com/admin/api/unstable/graphql.json",
+        access_token="token",
+        transport=httpx.AsyncHTTPTransport(),
+    )
+
+
+def test_get_connection_fields_resolves_forward_refs(
+    bulk_client_module: types.ModuleType,
+):
+    assert get_connection_fields(bulk_client_module.ProductsProductsEdgesNode) == [
+        ("variants", "ProductVariant")
+    ]
+
+
+def test_get_jsonl_stitches_children_into_parents(
+    bulk_client_module: types.ModuleType,
+    client: ShopifyAsyncBaseClient,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    body = b"\n".join(orjson.dumps(record) for record in BULK_JSONL) + b"\n"
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+    monkeypatch.setattr(
+        shopify_async_base_client,
+        "get_jsonl_client",
+        lambda: httpx.AsyncClient(transport=transport),
+    )
+
+    async def collect() -> list[Any]:
+        return [
+            item
+            async for item in client.get_jsonl(
+                "https://storage.example.com/bulk.jsonl", TYPENAME_TO_CLASS_MAP
+            )
+        ]
+
+    products = asyncio.run(collect())
+
+    assert [product.id for product in products] == [
+        "gid://shopify/Product/1",
+        "gid://shopify/Product/2",
+        "gid://shopify/Product/3",
+    ]
+    assert [
+        [edge.node.sku for edge in product.variants.edges] for product in products
+    ] == [["TEE-S", "TEE-M"], [], [None]]
+
+
+def test_get_jsonl_yields_valid_parents_before_an_invalid_one(
+    bulk_client_module: types.ModuleType,
+    client: ShopifyAsyncBaseClient,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    records = [dict(record) for record in BULK_JSONL]
+    del records[4]["title"]  # Product 3
+    body = b"\n".join(orjson.dumps(record) for record in records) + b"\n"
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+    monkeypatch.setattr(
+        shopify_async_base_client,
+        "get_jsonl_client",
+        lambda: httpx.AsyncClient(transport=transport),
+    )
+    products: list[Any] = []
+
+    async def collect():
+        async for item in client.get_jsonl(
+            "https://storage.example.com/bulk.jsonl", TYPENAME_TO_CLASS_MAP
+        ):
+            products.append(item)
+
+    with pytest.raises(ValidationError):
+        asyncio.run(collect())
+
+    assert [product.id for product in products] == [
+        "gid://shopify/Product/1",
+        "gid://shopify/Product/2",
+    ]
+
+
+def test_closing_one_client_leaves_others_usable():
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(200, json={"data": {}})
+    )
+    url = "https://shop.myshopify.com/admin/api/unstable/graphql.json"
+    first = ShopifyAsyncBaseClient(url=url, access_token="token", transport=transport)
+    second = ShopifyAsyncBaseClient(url=url, access_token="token", transport=transport)
+
+    async def run() -> httpx.Response:
+        async with first:
+            pass
+        return await second.execute("query { shop { id } }")
+
+    assert asyncio.run(run()).status_code == 200
+
+
+def recursive_flatten(json_data: Any) -> Any:
+    # The original recursive implementation, kept as the reference behaviour
+    if isinstance(json_data, dict):
+        if "edges" in json_data:
+            return [recursive_flatten(edge["node"]) for edge in json_data["edges"]]
+        return {key: recursive_flatten(value) for key, value in json_data.items()}
+    if isinstance(json_data, list):
+        return [recursive_flatten(item) for item in json_data]
+    return json_data
+
+
+def test_flatten_gql_response_unwraps_nested_edges(client: ShopifyAsyncBaseClient):
+    data = {
+        "products": {
+            "edges": [
+                {
+                    "cursor": "a",
+                    "node": {
+                        "id": "gid://shopify/Product/1",
+                        "tags": ["summer", "sale"],
+                        "variants": {
+                            "edges": [
+                                {"node": {"id": "gid://shopify/ProductVariant/11"}},
+                                {"node": {"id": "gid://shopify/ProductVariant/12"}},
+                            ]
+                        },
+                        "metafields": {"edges": []},
+                        "seo": {"title": None},
+                    },
+                },
+                {"cursor": "b", "node": {"id": "gid://shopify/Product/2"}},
+            ],
+            "pageInfo": {"hasNextPage": False},
+        },
+        "shop": {"name": "Shop"},
+    }
+
+    flattened = client.flatten_gql_response(data)
+
+    assert flattened == {
+        "products": [
+            {
+                "id": "gid://shopify/Product/1",
+                "tags": ["summer", "sale"],
+                "variants": [
+                    {"id": "gid://shopify/ProductVariant/11"},
+                    {"id": "gid://shopify/ProductVariant/12"},
+                ],
+                "metafields": [],
+                "seo": {"title": None},
+            },
+            {"id": "gid://shopify/Product/2"},
+        ],
+        "shop": {"name": "Shop"},
+    }
+    assert flattened == recursive_flatten(data)
+    # Key order is kept, as the recursive version did
+    assert list(flattened["products"][0]) == [
+        "id",
+        "tags",
+        "variants",
+        "metafields",
+        "seo",
+    ]
+
+
+@pytest.mark.parametrize("value", [None, 1, "text", [], [1, [2, {"a": 3}]]])
+def test_flatten_gql_response_passes_through_non_connections(
+    client: ShopifyAsyncBaseClient, value: Any
+):
+    assert client.flatten_gql_response(value) == recursive_flatten(value)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64 * 1024])
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_aiter_jsonl_lines_joins_lines_split_across_chunks(
+    chunk_size: int, trailing_newline: bool
+):
+    lines = [orjson.dumps(record) for record in BULK_JSONL]
+    # Blank lines are skipped wherever they fall
+    body = b"\n".join([lines[0], b"", *lines[1:]])
+    if trailing_newline:
+        body += b"\n"
+    response = httpx.Response(200, content=body)
+
+    async def collect() -> list[bytes]:
+        return [line async for line in aiter_jsonl_lines(response, chunk_size)]
+
+    assert asyncio.run(collect()) == lines
+
+
+def test_inject_variables_replaces_repeated_and_keeps_missing(
+    client: ShopifyAsyncBaseClient,
+):
+    query = (
+        "query products($first: Int!, $query: String, $after: String) {\n"
+        "  products(first: $first, query: $query, after: $after) {\n"
+        "    edges { node { variants(first: $first) { edges { node { id } } } } }\n"
+        "  }\n"
+        "}"
+    )
+
+    injected = client.inject_variables(
+        query, {"first": 250, "query": 'title:"Tee"', "unused": True}
+    )
+
+    assert injected == (
+        "query products {\n"
+        '  products(first: 250, query: "title:\\"Tee\\"", after: $after) {\n'
+        "    edges { node { variants(first: 250) { edges { node { id } } } } }\n"
+        "  }\n"
+        "}"
+    )
+
+
+def test_inject_variables_encodes_literals(client: ShopifyAsyncBaseClient):
+    injected = client.inject_variables(
+        "query q($a: Boolean, $b: String, $c: ID) { f(a: $a, b: $b, c: $c) }",
+        {"a": False, "b": None, "c": "gid://shopify/Product/1"},
+    )
+
+    assert injected == 'query q { f(a: false, b: null, c: "gid://shopify/Product/1") }'
+
+
+def test_inject_variables_encodes_datetimes_as_iso(client: ShopifyAsyncBaseClient):
+    injected = client.inject_variables(
+        "query q($since: DateTime) { f(query: $since) }",
+        {"since": datetime(2024, 1, 1, tzinfo=timezone.utc)},
+    )
+
+    assert injected == 'query q { f(query: "2024-01-01T00:00:00Z") }'
+
+
+@pytest.fixture
+def limiter(monkeypatch: pytest.MonkeyPatch) -> AsyncLimiterTransport:
+    limiter = AsyncLimiterTransport()
+    # No refills, so capacity only comes back when returned or synced
+    monkeypatch.setattr(limiter, "_refill", lambda: None)
+    return limiter
+
+
+def test_limiter_releases_waiters_in_order_as_capacity_returns(
+    limiter: AsyncLimiterTransport,
+):
+    acquired: list[int] = []
+
+    async def acquire(cost: int, request_id: int):
+        await limiter.acquire(cost, request_id)
+        acquired.append(request_id)
+
+    async def run():
+        await acquire(15000, 1)
+        assert limiter.current_capacity == 5000
+
+        tasks = [
+            asyncio.create_task(acquire(cost, request_id))
+            for cost, request_id in ((8000, 2), (1000, 3), (4000, 4), (500, 5))
+        ]
+        await asyncio.sleep(0)
+        # 3 would fit, but queues behind 2 so large requests aren't starved
+        assert acquired == [1]
+        assert limiter.current_capacity == 5000
+
+        limiter._return_capacity(3000)
+        await asyncio.sleep(0)
+        assert acquired == [1, 2]
+        assert limiter.current_capacity == 0
+
+        await limiter.sync_with_server(1200, 6)
+        await asyncio.sleep(0)
+        # 4 doesn't fit in what's left, so 5 keeps waiting behind it
+        assert acquired == [1, 2, 3]
+        assert limiter.current_capacity == 200
+
+        tasks[2].cancel()
+        limiter._return_capacity(300)
+        await asyncio.sleep(0)
+        assert acquired == [1, 2, 3, 5]
+        assert limiter.current_capacity == 0
+        assert not limiter.waiters
+
+        # Returned capacity never exceeds the bucket size
+        limiter._return_capacity(limiter.TOTAL_CAPACITY * 2)
+        assert limiter.current_capacity == limiter.TOTAL_CAPACITY
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_verify_webhook_accepts_valid_signature():
+    digest = hmac.new(b"secret", b"payload", digestmod=hashlib.sha256).digest()
+    header = base64.b64encode(digest).decode()
+
+    assert verify_webhook(b"payload", header, "secret")
+    assert not verify_webhook(b"tampered", header, "secret")
+
+
+@pytest.mark.parametrize("header", ["é", "not base64!", "abc", ""])
+def test_verify_webhook_rejects_malformed_headers(header: str):
+    assert verify_webhook(b"payload", header, "secret") is False
+
+
+def test_jsonl_client_is_not_reused_across_event_loops():
+    async def get_client() -> httpx.AsyncClient:
+        client = shopify_async_base_client.get_jsonl_client()
+        assert shopify_async_base_client.get_jsonl_client() is client
+        return client
+
+    first = asyncio.run(get_client())
+    second = asyncio.run(get_client())
+
+    assert first is not second
+
+
+def test_limiter_skips_cancelled_head_waiter(limiter: AsyncLimiterTransport):
+    async def run():
+        await limiter.acquire(15000, 1)
+        head = asyncio.create_task(limiter.acquire(8000, 2))
+        await asyncio.sleep(0)
+        head.cancel()
+        await asyncio.gather(head, return_exceptions=True)
+
+        # Nothing is left waiting, so this fits without waiting for a wakeup
+        await asyncio.wait_for(limiter.acquire(1000, 3), timeout=1)
+        assert limiter.current_capacity == 4000
+        assert not limiter.waiters
+
+    asyncio.run(run())
+
+
+def test_limiter_schedules_wakeups_on_later_event_loops(
+    limiter: AsyncLimiterTransport,
+):
+    async def wait_for_capacity() -> None:
+        limiter.current_capacity = 0
+        waiter = asyncio.create_task(limiter.acquire(1000, 1))
+        await asyncio.sleep(0)
+        assert limiter.wakeup_loop is asyncio.get_running_loop()
+        assert limiter.wakeup_handle is not None
+        assert not limiter.wakeup_handle.cancelled()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    # The first loop ends with its wakeup still scheduled
+    asyncio.run(wait_for_capacity())
+    asyncio.run(wait_for_capacity())
+
+
+class BulkOperationStatus(enum.Enum):
+    CREATED = "CREATED"
+    RUNNING = "RUNNING"
+    CANCELING = "CANCELING"
+    COMPLETED = "COMPLETED"
+
+
+class BulkOperation(types.SimpleNamespace):
+    pass
+
+
+def test_run_bulk_operation_polls_at_most_every_max_interval(
+    client: ShopifyAsyncBaseClient, monkeypatch: pytest.MonkeyPatch
+):
+    sleeps: list[float] = []
+
+    async def sleep(delay: float):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(shopify_async_base_client.asyncio, "sleep", sleep)
+    statuses = [BulkOperationStatus.RUNNING] * 8 + [BulkOperationStatus.COMPLETED]
+
+    async def operation_callable(query: str) -> types.SimpleNamespace:
+        return types.SimpleNamespace(
+            bulk_operation=BulkOperation(id="1", status=BulkOperationStatus.CREATED)
+        )
+
+    async def check_callable(bulk_operation_id: str) -> BulkOperation:
+        return BulkOperation(
+            id=bulk_operation_id,
+            status=statuses.pop(0),
+            created_at=datetime.now(timezone.utc),
+            object_count="0",
+            url=None,
+        )
+
+    async def run() -> list[Any]:
+        return [
+            item
+            async for item in client.run_bulk_operation(
+                operation_callable,
+                check_callable,
+                "query products { products { edges { node { id } } } }",
+                {},
+                BulkOperationStatus,
+                BulkOperation,
+                {},
+            )
+        ]
+
+    assert asyncio.run(run()) == []
+    assert len(sleeps) == 9
+    assert sleeps[0] == client.BULK_POLL_MIN_INTERVAL
+    assert sleeps == sorted(sleeps)
+    assert max(sleeps) == client.BULK_POLL_MAX_INTERVAL == 2
+
+
+def test_install_uvloop_is_a_no_op_without_uvloop(monkeypatch: pytest.MonkeyPatch):
+    policy = asyncio.get_event_loop_policy()
+    # A None entry makes the import fail as if uvloop wasn't installed
+    monkeypatch.setitem(sys.modules, "uvloop", None)
+
+    assert install_uvloop() is False
+    assert asyncio.get_event_loop_policy() is policy
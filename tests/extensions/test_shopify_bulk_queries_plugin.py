@@ -0,0 +1,224 @@
+import ast
+import importlib
+import importlib.util
+import pathlib
+import sys
+import types
+
+import pytest
+from ariadne_codegen.config import get_config_dict, get_section
+from ariadne_codegen.plugins.explorer import get_plugins_types
+from ariadne_codegen.plugins.manager import PluginManager
+from graphql import GraphQLSchema
+
+from graphpyshop.extensions.shopify_bulk_queries_plugin import ShopifyBulkQueriesPlugin
+
+from .conftest import GENERATED_RESULT_TYPES
+
+
+def test_generated_models_are_resolved_before_validation(
+    client_module: types.ModuleType,
+):
+    # The base client introspects model_fields before validating anything
+    node_class = client_module.ProductsProductsEdgesNode
+    assert node_class.model_fields["variants"].annotation is (
+        client_module.ProductsProductsEdgesNodeVariants
+    )
+
+
+# A client module after ClientForwardRefsPlugin moved result imports under
+# TYPE_CHECKING, with BulkOperationStatus already imported from .enums
+GENERATED_CLIENT = """
+from typing import TYPE_CHECKING, Any, Dict
+
+from .async_base_client import AsyncBaseClient
+from .enums import BulkOperationStatus
+
+if TYPE_CHECKING:
+    from .bulk_operation import BulkOperationNodeBulkOperation
+    from .products import ProductsProducts
+
+
+class ShopifyClient(AsyncBaseClient):
+    async def products(self, first: int, **kwargs: Any) -> "ProductsProducts":
+        variables: Dict[str, object] = {"first": first}
+        response = await self.execute(query=PRODUCTS_GQL, variables=variables, **kwargs)
+        data = self.get_data(response)
+        return ProductsProducts.model_validate(data).products
+"""
+
+
+def runtime_imports(module: ast.Module) -> set[tuple[str, str]]:
+    return {
+        ("." * stmt.level + (stmt.module or ""), alias.name)
+        for stmt in module.body
+        if isinstance(stmt, ast.ImportFrom)
+        for alias in stmt.names
+    }
+
+
+@pytest.fixture
+def generated_package(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    # Return types are looked up in the generated package relative to the cwd
+    client_path = tmp_path / "graphpyshop" / "client"
+    client_path.mkdir(parents=True)
+    (client_path / "products.py").write_text(GENERATED_RESULT_TYPES)
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.mark.usefixtures("generated_package")
+def test_client_module_imports_bulk_names_at_runtime(
+    plugin: ShopifyBulkQueriesPlugin,
+):
+    module = plugin.generate_client_module(ast.parse(GENERATED_CLIENT))
+
+    methods = [
+        node.name for node in ast.walk(module) if isinstance(node, ast.AsyncFunctionDef)
+    ]
+    assert methods == ["products", "bq_products"]
+    imports = runtime_imports(module)
+    assert ("typing", "AsyncGenerator") in imports
+    assert (".bulk_operation", "BulkOperationNodeBulkOperation") in imports
+    # Already imported at runtime, so not imported a second time
+    assert (
+        sum(
+            alias.name == "BulkOperationStatus"
+            for stmt in ast.walk(module)
+            if isinstance(stmt, ast.ImportFrom)
+            for alias in stmt.names
+        )
+        == 1
+    )
+
+
+@pytest.fixture
+def two_bulk_methods_module(
+    plugin: ShopifyBulkQueriesPlugin, generated_package: None
+) -> ast.Module:
+    # Two queries returning the same connection, so both bulk methods are built
+    # from the same cached scan of the result types module
+    source = GENERATED_CLIENT + (
+        "\n"
+        "    async def other_products(\n"
+        "        self, first: int, **kwargs: Any\n"
+        '    ) -> "ProductsProducts":\n'
+        '        variables: Dict[str, object] = {"first": first}\n'
+        "        response = await self.execute(\n"
+        "            query=OTHER_PRODUCTS_GQL, variables=variables, **kwargs\n"
+        "        )\n"
+        "        data = self.get_data(response)\n"
+        "        return ProductsProducts.model_validate(data).products\n"
+    )
+    return plugin.generate_client_module(ast.parse(source))
+
+
+def assert_no_shared_nodes(nodes: list[ast.AST]):
+    assert len(nodes) == 2
+    # Expression contexts are stateless and shared on purpose
+    first, second = (
+        {
+            id(child)
+            for child in ast.walk(node)
+            if not isinstance(child, ast.expr_context)
+        }
+        for node in nodes
+    )
+    assert not first & second
+
+
+def test_bulk_methods_do_not_share_typename_nodes(two_bulk_methods_module: ast.Module):
+    assert_no_shared_nodes(
+        [
+            node
+            for node in ast.walk(two_bulk_methods_module)
+            if isinstance(node, ast.Dict)
+            and any(
+                isinstance(key, ast.Constant) and key.value == "Product"
+                for key in node.keys
+            )
+        ]
+    )
+
+
+def test_bulk_methods_do_not_share_return_annotations(
+    two_bulk_methods_module: ast.Module,
+):
+    bulk_methods = [
+        node
+        for node in ast.walk(two_bulk_methods_module)
+        if isinstance(node, ast.AsyncFunctionDef) and node.name.startswith("bq_")
+    ]
+    assert [
+        ast.unparse(method.returns) for method in bulk_methods if method.returns
+    ] == ["AsyncGenerator['ProductsProductsEdgesNode', None]"] * 2
+    assert_no_shared_nodes([method.returns for method in bulk_methods])
+
+
+def test_init_module_imports_exports_lazily(
+    plugin: ShopifyBulkQueriesPlugin,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    init_module = plugin.generate_init_module(
+        ast.parse(
+            "from .enums import BulkOperationStatus\n"
+            "from .products import Products, ProductsProducts\n"
+            '__all__ = ["BulkOperationStatus", "Products", "ProductsProducts"]\n'
+        )
+    )
+    package_path = tmp_path / "lazy_client"
+    package_path.mkdir()
+    (package_path / "__init__.py").write_text(ast.unparse(init_module))
+    (package_path / "enums.py").write_text("BulkOperationStatus = 'enum'\n")
+    (package_path / "products.py").write_text(GENERATED_RESULT_TYPES)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name in ("lazy_client", "lazy_client.enums", "lazy_client.products"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+
+    package = importlib.import_module("lazy_client")
+
+    assert "lazy_client.products" not in sys.modules
+    assert "Products" in dir(package)
+    assert package.Products.__name__ == "Products"
+    assert "lazy_client.products" in sys.modules
+    assert "lazy_client.enums" not in sys.modules
+    assert package.BulkOperationStatus == "enum"
+    with pytest.raises(AttributeError):
+        _ = package.Missing
+
+
+def test_configured_plugins_generate_lazy_init_module(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+):
+    # Run the plugins in the order the repo's own pyproject.toml lists them, from
+    # a copy of the repo as some of them write files into the target package
+    repo_path = pathlib.Path(__file__).parents[2]
+    (tmp_path / "pyproject.toml").write_bytes(
+        (repo_path / "pyproject.toml").read_bytes()
+    )
+    (tmp_path / "graphpyshop" / "client").mkdir(parents=True)
+    for directory in ("extensions", "queries"):
+        (tmp_path / "graphpyshop" / directory).symlink_to(
+            repo_path / "graphpyshop" / directory
+        )
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("SHOPIFY_ACCESS_TOKEN", "token")
+    config_dict = get_config_dict()
+    # Some contrib plugins are newer than the pinned ariadne-codegen
+    plugins = [
+        plugin
+        for plugin in get_section(config_dict)["plugins"]
+        if importlib.util.find_spec(plugin.rsplit(".", 1)[0]) is not None
+    ]
+    assert "graphpyshop.extensions.ShopifyBulkQueriesPlugin" in plugins
+    plugin_manager = PluginManager(
+        schema=GraphQLSchema(),
+        config_dict=config_dict,
+        plugins_types=get_plugins_types(plugins),
+    )
+
+    module = plugin_manager.generate_init_module(
+        ast.parse('from .products import Products\n__all__ = ["Products"]\n')
+    )
+
+    assert "_LAZY_IMPORTS = {'Products': '.products'}" in ast.unparse(module)